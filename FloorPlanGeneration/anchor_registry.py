@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class AnchorRegistry:
+    """Anchor devices stamped with server time, expired by a timer heap.
+
+    Each registration (re)sets the anchor's deadline to ``now + ttl`` and
+    pushes it on a heap; expiry pops deadlines that have passed, skipping
+    entries superseded by a later heartbeat, so it costs nothing while no
+    anchor is due. At most ``max_anchors`` are kept (the one closest to
+    expiry is evicted) and the heap is rebuilt when stale entries pile up.
+
+    Every change gets a version number and goes into a bounded log, so a
+    client that knows the last version it saw can fetch only the changes
+    since then, or wait for the next one. A client that fell further
+    behind than the log reaches gets a full snapshot instead.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_anchors: int = 1024, max_changes: int = 1024):
+        self.ttl = float(ttl)
+        self.max_anchors = max(1, int(max_anchors))
+        self._anchors: Dict[str, Dict] = {}
+        self._deadlines: List[Tuple[float, str]] = []
+        self._changes = deque(maxlen=max(1, int(max_changes)))
+        self.version = 0
+        self.expired = 0
+        self.evicted = 0
+        self._changed = threading.Condition()
+
+    def _public(self, anchor_id: str, anchor: Dict) -> Dict:
+        return {'id': anchor_id, 'x': anchor['x'], 'y': anchor['y'], 'active': True,
+                'lastSeen': anchor['last_seen']}
+
+    def _record(self, kind: str, anchor_id: str, anchor: Optional[Dict] = None):
+        self.version += 1
+        change = {'version': self.version, 'type': kind, 'id': anchor_id}
+        if anchor is not None:
+            change.update(x=anchor['x'], y=anchor['y'], lastSeen=anchor['last_seen'])
+        self._changes.append(change)
+        self._changed.notify_all()
+
+    def _expire(self, now: float):
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, anchor_id = heapq.heappop(self._deadlines)
+            anchor = self._anchors.get(anchor_id)
+            # Heartbeats leave their old deadlines behind
+            if anchor is not None and anchor['expires'] == deadline:
+                del self._anchors[anchor_id]
+                self.expired += 1
+                self._record('expire', anchor_id)
+
+    def _evict_oldest(self):
+        while self._deadlines:
+            deadline, anchor_id = heapq.heappop(self._deadlines)
+            anchor = self._anchors.get(anchor_id)
+            if anchor is not None and anchor['expires'] == deadline:
+                del self._anchors[anchor_id]
+                self.evicted += 1
+                self._record('remove', anchor_id)
+                return
+
+    def register(self, anchor_id: str, x: float, y: float) -> Dict:
+        """Add or refresh an anchor; moved or new anchors are recorded as changes."""
+        now = time.time()
+        with self._changed:
+            self._expire(now)
+            anchor = self._anchors.get(anchor_id)
+            if anchor is None and len(self._anchors) >= self.max_anchors:
+                self._evict_oldest()
+            moved = anchor is None or (anchor['x'], anchor['y']) != (x, y)
+            anchor = self._anchors[anchor_id] = {'x': x, 'y': y, 'last_seen': now, 'expires': now + self.ttl}
+            heapq.heappush(self._deadlines, (anchor['expires'], anchor_id))
+            if len(self._deadlines) > 2 * len(self._anchors) + 64:
+                self._deadlines = [(a['expires'], aid) for aid, a in self._anchors.items()]
+                heapq.heapify(self._deadlines)
+            if moved:
+                self._record('register', anchor_id, anchor)
+            return self._public(anchor_id, anchor)
+
+    def unregister(self, anchor_id: str) -> bool:
+        with self._changed:
+            self._expire(time.time())
+            if self._anchors.pop(anchor_id, None) is None:
+                return False
+            self._record('remove', anchor_id)
+            return True
+
+    def snapshot(self) -> Tuple[int, List[Dict]]:
+        """``(version, anchors)`` for every live anchor."""
+        with self._changed:
+            self._expire(time.time())
+            return self.version, [self._public(aid, anchor) for aid, anchor in self._anchors.items()]
+
+    def changes(self, since: int, timeout: float = 0.0) -> Tuple[int, Optional[List[Dict]]]:
+        """``(version, changes)`` after version ``since``, waiting up to ``timeout``.
+
+        ``changes`` is None when the log no longer reaches back to ``since``
+        (or ``since`` is from before a restart); fetch a snapshot then.
+        """
+        deadline = time.time() + timeout
+        with self._changed:
+            while True:
+                now = time.time()
+                self._expire(now)
+                if since > self.version or (self._changes and since < self._changes[0]['version'] - 1):
+                    return self.version, None
+                if since < self.version or now >= deadline:
+                    break
+                # Wake for the next expiry too, it is a change to report
+                wait = deadline - now
+                if self._deadlines:
+                    wait = min(wait, max(0.0, self._deadlines[0][0] - now) + 0.001)
+                self._changed.wait(wait)
+            skip = len(self._changes) - (self.version - since)
+            return self.version, list(itertools.islice(self._changes, skip, None))
+
+    def stats(self) -> Dict:
+        with self._changed:
+            return {'anchors': len(self._anchors), 'version': self.version,
+                    'expired': self.expired, 'evicted': self.evicted}
@@ -1,24 +1,29 @@
 #!/usr/bin/env python3
 
 import yaml
+import hashlib
+import math
+import threading
+import uuid
 import numpy as np
-from PIL import Image
 import heapq
-import matplotlib.pyplot as plt
-import json
 from typing import List, Tuple, Optional, Dict
-import cv2
+from grid_search import GridAStar, BidirectionalAStar, JumpPointSearch, half_scale_table
+from hierarchical_planner import HierarchicalPlanner
+from flow_fields import FlowFieldCache
+from map_artifacts import ArtifactStore
+from location_store import LocationStore
+
+# PIL, cv2 and matplotlib are imported where used: a server starting from
+# cached artifacts never decodes the image or plots
+
+PLANNERS = ('astar', 'astar_legacy', 'bidirectional', 'hpa', 'jps', 'flow_field')
 
 class FloorPlanNavigator:
     def __init__(self, config_path: str):
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
         
-        self.image = Image.open(self.config['image'])
-        self.map_array = np.array(self.image.convert('L'))
-        
-        self.map_array = (self.map_array < 128).astype(np.uint8)
-        
         self.resolution = self.config['resolution']
         self.width_meters = self.config['width_meters']
         self.height_meters = self.config['height_meters']
@@ -26,21 +31,243 @@ class FloorPlanNavigator:
         self.robot_radius_pixels = int(self.config['robot_radius'] / self.resolution)
         self.inflation_radius_pixels = int(self.config['inflation_radius'] / self.resolution)
         
-        self.inflated_map = self._inflate_obstacles()
-        
         self.allow_diagonal = self.config.get('allow_diagonal', True)
         self.diagonal_cost = self.config.get('diagonal_cost', 1.414)
         self.straight_cost = self.config.get('straight_cost', 1.0)
+        self.cost_scaling_factor = self.config.get('cost_scaling_factor', 10.0)
+        self.clearance_weight = self.config.get('clearance_weight', 0.0)
+        
+        self.map_signature = self._compute_map_signature()
+        self.artifacts = None
+        if self.config.get('artifact_dir'):
+            self.artifacts = ArtifactStore(self.config['artifact_dir'], self.map_signature)
+        
+        grids = self.artifacts.load('grid', mmap_mode='c') if self.artifacts else None
+        if grids is not None:
+            self.map_array = grids['map_array']
+            self.inflated_map = grids['inflated_map']
+        else:
+            self.map_array = np.array(self.image.convert('L'))
+            self.map_array = (self.map_array < 128).astype(np.uint8)
+            self.inflated_map = self._inflate_obstacles()
+            if self.artifacts:
+                self.artifacts.save('grid', map_array=self.map_array, inflated_map=self.inflated_map)
+        
+        costs = self.artifacts.load('costmap') if self.artifacts else None
+        if costs is not None:
+            self.costmap = costs['costmap']
+        else:
+            self.costmap = self._compute_costmap()
+            if self.artifacts:
+                self.artifacts.save('costmap', costmap=self.costmap)
+        
+        self.planner = self.config.get('planner', 'astar')
+        if self.planner not in PLANNERS:
+            raise ValueError(f"Unknown planner '{self.planner}', expected one of {PLANNERS}")
+        self._grid_astar = None
+        self._jump_point = None
+        self._bidirectional = None
+        self._hierarchical = None
+        self._flow_fields = None
+        self._snap_index = None
+        self.snap_max_distance = self.config.get('snap_max_distance', 0.5)
+        # Runtime obstacles (pixel polygons) drawn over the image's walls
+        self.obstacles: Dict[str, np.ndarray] = {}
+        self._base_map = None
+        self._update_lock = threading.Lock()
+        if self.planner == 'hpa':
+            self._hierarchical = self._build_hierarchical()
+    
+    def _compute_map_signature(self) -> str:
+        # Anything derived from the grid is only valid for this image and these settings
+        digest = hashlib.sha1()
+        with open(self.config['image'], 'rb') as f:
+            digest.update(f.read())
+        for key in ('resolution', 'robot_radius', 'inflation_radius',
+                    'allow_diagonal', 'diagonal_cost', 'straight_cost',
+                    'cost_scaling_factor', 'clearance_weight'):
+            digest.update(f"{key}={self.config.get(key)!r};".encode())
+        return digest.hexdigest()
+    
+    @property
+    def image(self):
+        from PIL import Image
+        return Image.open(self.config['image'])
     
-    def _inflate_obstacles(self) -> np.ndarray:
+    def _inflate_obstacles(self, occupancy: Optional[np.ndarray] = None) -> np.ndarray:
+        import cv2
         kernel_size = 2 * self.inflation_radius_pixels + 1
         kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
-        inflated = cv2.dilate(self.map_array, kernel, iterations=1)
+        inflated = cv2.dilate(self.map_array if occupancy is None else occupancy, kernel, iterations=1)
         return inflated
     
+    def _compute_costmap(self, occupancy: Optional[np.ndarray] = None,
+                         inflated: Optional[np.ndarray] = None) -> np.ndarray:
+        """Clearance cost per cell: 254 inside inflated obstacles, otherwise
+        252 * exp(-cost_scaling_factor * (d - inflation_radius)) rounded to
+        uint8, where d is the distance in meters to the nearest wall."""
+        import cv2
+        occupancy = self.map_array if occupancy is None else occupancy
+        inflated = self.inflated_map if inflated is None else inflated
+        free = (occupancy == 0).astype(np.uint8)
+        distance = cv2.distanceTransform(free, cv2.DIST_L2, 5) * self.resolution
+        excess = np.maximum(distance - self.config['inflation_radius'], 0.0)
+        costmap = np.rint(252 * np.exp(-self.cost_scaling_factor * excess)).astype(np.uint8)
+        costmap[inflated != 0] = 254
+        return costmap
+    
+    def _costmap_reach(self) -> Optional[int]:
+        """Pixels from a wall beyond which its clearance cost rounds to 0,
+        or None when costs never decay (the whole costmap depends on it)."""
+        if self.cost_scaling_factor <= 0:
+            return None
+        # 252 * exp(-factor * excess) < 0.5 once excess > ln(504) / factor
+        meters = self.config['inflation_radius'] + math.log(504) / self.cost_scaling_factor
+        return int(math.ceil(meters / self.resolution)) + 2
+    
+    def add_obstacle(self, polygon: List[Tuple[int, int]], obstacle_id: Optional[str] = None):
+        """Block a polygon of pixel vertices at runtime.
+
+        Returns ``(obstacle_id, change)``; see ``_apply_obstacles``. An existing
+        id is replaced, so moving furniture is one call.
+        """
+        points = np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+        if len(points) < 3:
+            raise ValueError('An obstacle needs at least 3 vertices')
+        obstacle_id = str(obstacle_id) if obstacle_id is not None else uuid.uuid4().hex
+        with self._update_lock:
+            previous = self.obstacles.get(obstacle_id)
+            self.obstacles[obstacle_id] = points
+            bounds = self._polygon_bounds(points)
+            if previous is not None:
+                old = self._polygon_bounds(previous)
+                bounds = (min(bounds[0], old[0]), min(bounds[1], old[1]),
+                          max(bounds[2], old[2]), max(bounds[3], old[3]))
+            return obstacle_id, self._apply_obstacles(*bounds)
+    
+    def remove_obstacle(self, obstacle_id: str):
+        """Remove a runtime obstacle; returns the change like ``add_obstacle``.
+
+        Raises KeyError for an unknown id.
+        """
+        with self._update_lock:
+            points = self.obstacles.pop(obstacle_id)
+            return self._apply_obstacles(*self._polygon_bounds(points))
+    
+    def _polygon_bounds(self, points: np.ndarray) -> Tuple[int, int, int, int]:
+        height, width = self.map_array.shape
+        x0, y0 = np.maximum(points.min(axis=0), 0)
+        x1, y1 = np.minimum(points.max(axis=0) + 1, (width, height))
+        return int(x0), int(y0), int(max(x0, x1)), int(max(y0, y1))
+    
+    def _grow(self, x0: int, y0: int, x1: int, y1: int, margin: Optional[int]) -> Tuple[int, int, int, int]:
+        height, width = self.map_array.shape
+        if margin is None:
+            return 0, 0, width, height
+        return max(0, x0 - margin), max(0, y0 - margin), min(width, x1 + margin), min(height, y1 + margin)
+    
+    def _apply_obstacles(self, x0: int, y0: int, x1: int, y1: int) -> Optional[Dict]:
+        """Redraw the obstacles over ``[x0, x1) x [y0, y1)`` and refresh what depends on it.
+
+        Inflation is re-run on the box grown by the inflation radius and the
+        costmap on the box grown by ``_costmap_reach``; each from a crop
+        large enough to be exact. The engines, cached distance fields and
+        HPA* clusters are then updated for the cells that changed. Returns
+        None when no cell changed, otherwise a dict with the changed
+        ``cells`` (x, y), their bounding ``region`` (x0, y0, x1, y1) and
+        ``cheaper``, whether any cell was freed or got cheaper, which can
+        shorten routes that never touched the region.
+        """
+        import cv2
+        if x0 >= x1 or y0 >= y1:
+            return None
+        if self._base_map is None:
+            self._base_map = np.array(self.map_array)
+            # Arrays loaded from artifacts or shared memory may be read-only
+            self.map_array = np.array(self.map_array)
+            self.inflated_map = np.array(self.inflated_map)
+            self.costmap = np.array(self.costmap)
+        
+        occupancy = self._base_map[y0:y1, x0:x1].copy()
+        for points in self.obstacles.values():
+            cv2.fillPoly(occupancy, [points - (x0, y0)], 1)
+        self.map_array[y0:y1, x0:x1] = occupancy
+        
+        r = self.inflation_radius_pixels
+        reach = self._costmap_reach()
+        ix0, iy0, ix1, iy1 = self._grow(x0, y0, x1, y1, r)
+        cx0, cy0, cx1, cy1 = self._grow(x0, y0, x1, y1, None if reach is None else r + reach)
+        before_blocked = self.inflated_map[cy0:cy1, cx0:cx1] != 0
+        before_cost = self.costmap[cy0:cy1, cx0:cx1].copy()
+        
+        gx0, gy0, gx1, gy1 = self._grow(ix0, iy0, ix1, iy1, r)
+        inflated = self._inflate_obstacles(self.map_array[gy0:gy1, gx0:gx1])
+        self.inflated_map[iy0:iy1, ix0:ix1] = inflated[iy0 - gy0:iy1 - gy0, ix0 - gx0:ix1 - gx0]
+        
+        gx0, gy0, gx1, gy1 = self._grow(cx0, cy0, cx1, cy1, reach)
+        costmap = self._compute_costmap(self.map_array[gy0:gy1, gx0:gx1], self.inflated_map[gy0:gy1, gx0:gx1])
+        self.costmap[cy0:cy1, cx0:cx1] = costmap[cy0 - gy0:cy1 - gy0, cx0 - gx0:cx1 - gx0]
+        
+        after_blocked = self.inflated_map[cy0:cy1, cx0:cx1] != 0
+        changed = before_blocked != after_blocked
+        cheaper = bool(np.any(before_blocked & ~after_blocked))
+        if self.clearance_weight:
+            after_cost = self.costmap[cy0:cy1, cx0:cx1]
+            changed |= before_cost != after_cost
+            cheaper = cheaper or bool(np.any(~after_blocked & (after_cost < before_cost)))
+        ys, xs = np.nonzero(changed)
+        if len(xs) == 0:
+            return None
+        region = (cx0 + int(xs.min()), cy0 + int(ys.min()), cx0 + int(xs.max()) + 1, cy0 + int(ys.max()) + 1)
+        
+        if self._grid_astar is not None:
+            self._grid_astar.update_region(*region)
+        if self._flow_fields is not None:
+            self._flow_fields.invalidate(*region)
+        if self._hierarchical is not None:
+            self._hierarchical = self._build_hierarchical(previous=self._hierarchical, dirty=region)
+        # Connectivity may change anywhere, so the snap index is rebuilt on next use
+        self._snap_index = None
+        return {'cells': np.stack([xs + cx0, ys + cy0], axis=1), 'region': region, 'cheaper': cheaper}
+    
+    def route_affected(self, path: Optional[List[Tuple[int, int]]], change: Dict) -> bool:
+        """Whether a route found before ``change`` may now be wrong or suboptimal.
+        
+        A route is affected when it crosses the changed region, or, if the
+        change made cells cheaper, when a detour through the region could
+        beat its cost (octile lower bound). Unreachable pairs (no path) are
+        affected by any cheaper change.
+        """
+        if path is None or len(path) == 0:
+            return change['cheaper']
+        points = np.asarray(path)
+        x0, y0, x1, y1 = change['region']
+        if np.any((points[:, 0] >= x0) & (points[:, 0] < x1) & (points[:, 1] >= y0) & (points[:, 1] < y1)):
+            return True
+        if not change['cheaper']:
+            return False
+        (sx, sy), (gx, gy) = points[0], points[-1]
+        lower = (self.heuristic(sx, sy, min(max(sx, x0), x1 - 1), min(max(sy, y0), y1 - 1))
+                 + self.heuristic(min(max(gx, x0), x1 - 1), min(max(gy, y0), y1 - 1), gx, gy))
+        return lower < self.path_cost(points)
+    
+    def path_cost(self, path) -> float:
+        """Cost of a grid path under the planners' step costs, clearance included."""
+        if path is None or len(path) < 2:
+            return 0.0
+        points = np.asarray(path)
+        diagonal = (points[1:, 0] != points[:-1, 0]) & (points[1:, 1] != points[:-1, 1])
+        base = np.where(diagonal, self.diagonal_cost, self.straight_cost)
+        half = np.asarray(half_scale_table(self.clearance_weight))[self.costmap[points[:, 1], points[:, 0]]]
+        return float(np.sum(base * (half[1:] + half[:-1])))
+    
     def meters_to_pixels(self, x_meters: float, y_meters: float) -> Tuple[int, int]:
-        x_pixels = int(x_meters / self.resolution)
-        y_pixels = int(y_meters / self.resolution)
+        # Rounded, so pixels_to_meters output (even rounded to mm) maps back to its own pixel,
+        # except in the last half pixel of the grid, which would round past the far edge
+        height, width = self.inflated_map.shape
+        x, y = x_meters / self.resolution, y_meters / self.resolution
+        x_pixels = int(round(x)) if x < width - 0.5 else int(x)
+        y_pixels = int(round(y)) if y < height - 0.5 else int(y)
         return (x_pixels, y_pixels)
     
     def pixels_to_meters(self, x_pixels: int, y_pixels: int) -> Tuple[float, float]:
@@ -48,6 +275,78 @@ class FloorPlanNavigator:
         y_meters = y_pixels * self.resolution
         return (x_meters, y_meters)
     
+    @property
+    def snap_index(self) -> np.ndarray:
+        """Flat index ``y * width + x`` of the nearest navigable cell, per cell.
+
+        Navigable cells are the largest 8-connected free region of
+        ``inflated_map``; free pockets cut off by inflation are snapped out
+        of too. Built with a feature transform (distance transform with
+        pixel labels), so snapping is one lookup.
+        """
+        index = self._snap_index
+        if index is None:
+            saved = self.artifacts.load('snap') if self.artifacts and not self.obstacles else None
+            if saved is not None:
+                index = saved['nearest']
+            else:
+                index = self._compute_snap_index()
+                if self.artifacts and not self.obstacles:
+                    self.artifacts.save('snap', nearest=index)
+            self._snap_index = index
+        return index
+    
+    def _compute_snap_index(self) -> np.ndarray:
+        import cv2
+        height, width = self.inflated_map.shape
+        free = (self.inflated_map == 0).astype(np.uint8)
+        count, components, stats, _ = cv2.connectedComponentsWithStats(free, connectivity=8)
+        if count < 2:
+            return np.full((height, width), -1, dtype=np.int32)
+        largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+        navigable = components == largest
+        # Every cell gets the label of its nearest zero (navigable) pixel
+        _, labels = cv2.distanceTransformWithLabels(
+            (~navigable).astype(np.uint8), cv2.DIST_L2, 5, labelType=cv2.DIST_LABEL_PIXEL)
+        ys, xs = np.nonzero(navigable)
+        lookup = np.full(int(labels.max()) + 1, -1, dtype=np.int32)
+        lookup[labels[ys, xs]] = ys * width + xs
+        return lookup[labels]
+    
+    def snap_cells(self, cells) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest navigable cell for each (x, y) pixel row of ``cells``.
+        
+        Returns ``(targets, distances)``: target cells as an (n, 2) int
+        array and the distance to them in meters. Positions outside the map
+        are clamped first. Rows with no navigable cell within
+        ``snap_max_distance`` get target (-1, -1) and distance inf.
+        """
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        height, width = self.inflated_map.shape
+        xs = np.clip(cells[:, 0], 0, width - 1)
+        ys = np.clip(cells[:, 1], 0, height - 1)
+        nearest = self.snap_index[ys, xs].astype(np.int64)
+        targets = np.stack([nearest % width, nearest // width], axis=1)
+        distances = np.hypot(*(targets - cells).T) * self.resolution
+        missing = (nearest < 0) | (distances > self.snap_max_distance)
+        targets[missing] = -1
+        distances[missing] = np.inf
+        return targets, distances
+    
+    def is_navigable(self, x: int, y: int) -> bool:
+        """True for a cell of the largest free region, which ``snap`` leaves in place."""
+        height, width = self.inflated_map.shape
+        if x < 0 or x >= width or y < 0 or y >= height:
+            return False
+        return int(self.snap_index[y, x]) == y * width + x
+    
+    def snap(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """Nearest navigable cell to pixel (x, y), itself if navigable, or None."""
+        targets, distances = self.snap_cells([(x, y)])
+        if not np.isfinite(distances[0]):
+            return None
+        return int(targets[0, 0]), int(targets[0, 1])
+    
     def is_valid_position(self, x: int, y: int) -> bool:
         if x < 0 or x >= self.inflated_map.shape[1] or y < 0 or y >= self.inflated_map.shape[0]:
             return False
@@ -78,7 +377,18 @@ class FloorPlanNavigator:
         else:
             return abs(x2 - x1) + abs(y2 - y1)
     
-    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[List[Tuple[int, int]]]:
+    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int],
+                  planner: Optional[str] = None, stats: Optional[dict] = None) -> Optional[List[Tuple[int, int]]]:
+        """Route with the given planner (default ``self.planner``).
+
+        A ``stats`` dict is filled with the planner's counters: ``expanded``,
+        ``pushes`` and ``open_peak`` for the grid engines, ``cache_hit`` for
+        ``flow_field`` and ``fallback`` for ``hpa``.
+        """
+        planner = planner or self.planner
+        if planner not in PLANNERS:
+            raise ValueError(f"Unknown planner '{planner}', expected one of {PLANNERS}")
+        
         if not self.is_valid_position(start[0], start[1]):
             print(f"Start position {start} is invalid (occupied or out of bounds)")
             return None
@@ -86,6 +396,93 @@ class FloorPlanNavigator:
             print(f"Goal position {goal} is invalid (occupied or out of bounds)")
             return None
         
+        if planner == 'astar_legacy':
+            return self._find_path_legacy(start, goal)
+        if planner == 'hpa':
+            return self.hierarchical.find_path(start, goal, stats=stats)
+        if planner == 'jps':
+            return self.jump_point.find_path(start, goal, stats=stats)
+        if planner == 'bidirectional':
+            return self.bidirectional.find_path(start, goal, stats=stats)
+        if planner == 'flow_field':
+            return self.flow_fields.find_path(start, goal, stats=stats)
+        return self.grid_astar.find_path(start, goal, stats=stats)
+    
+    @property
+    def grid_astar(self) -> GridAStar:
+        if self._grid_astar is None:
+            self._grid_astar = GridAStar(self)
+        return self._grid_astar
+    
+    @property
+    def jump_point(self) -> JumpPointSearch:
+        if self._jump_point is None:
+            self._jump_point = JumpPointSearch(self, shared=self.grid_astar)
+        return self._jump_point
+    
+    @property
+    def bidirectional(self) -> BidirectionalAStar:
+        if self._bidirectional is None:
+            self._bidirectional = BidirectionalAStar(self, shared=self.grid_astar)
+        return self._bidirectional
+    
+    @property
+    def flow_fields(self) -> FlowFieldCache:
+        if self._flow_fields is None:
+            self._flow_fields = FlowFieldCache(
+                self,
+                max_fields=self.config.get('flow_field_cache_size', 8),
+                max_bytes=int(self.config.get('flow_field_cache_mb', 256) * 1024 * 1024))
+        return self._flow_fields
+    
+    @property
+    def hierarchical(self) -> HierarchicalPlanner:
+        if self._hierarchical is None:
+            self._hierarchical = self._build_hierarchical()
+        return self._hierarchical
+    
+    def memory_bytes(self) -> int:
+        """Bytes held in arrays by the grids and the planners built so far.
+
+        An estimate for memory budgets: arrays are counted once even when
+        engines share them, and dict-based graphs are not counted.
+        """
+        holders = [self] + [engine for engine in (self._grid_astar, self._jump_point, self._bidirectional,
+                                                  self._hierarchical) if engine is not None]
+        seen = set()
+        total = 0
+        for holder in holders:
+            for value in vars(holder).values():
+                if isinstance(value, (np.ndarray, bytearray)) and id(value) not in seen:
+                    seen.add(id(value))
+                    total += value.nbytes if isinstance(value, np.ndarray) else len(value)
+        if self._flow_fields is not None:
+            total += self._flow_fields.stats()['bytes']
+        return total
+
+    def share_memory(self, shared) -> None:
+        """Move the grids into ``shared`` (a ``SharedArrays``) and build the
+        configured planners, so forked workers inherit one read-only copy."""
+        self.map_array = shared.publish('map_array', self.map_array)
+        self.inflated_map = shared.publish('inflated_map', self.inflated_map)
+        self.costmap = shared.publish('costmap', self.costmap)
+        self.jump_point
+        if self._hierarchical is not None:
+            self._hierarchical.free = shared.publish('hpa_free', self._hierarchical.free)
+    
+    def _build_hierarchical(self, previous: Optional[HierarchicalPlanner] = None,
+                            dirty: Optional[Tuple[int, int, int, int]] = None) -> HierarchicalPlanner:
+        return HierarchicalPlanner(
+            self,
+            cluster_size=self.config.get('hpa_cluster_size', 64),
+            entrance_spacing=self.config.get('hpa_entrance_spacing', 64),
+            suboptimality=self.config.get('hpa_suboptimality', 1.25),
+            # Artifacts are keyed by the image; runtime obstacles must not be saved
+            artifacts=None if self.obstacles else self.artifacts,
+            previous=previous,
+            dirty=dirty)
+    
+    def _find_path_legacy(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[List[Tuple[int, int]]]:
         open_set = []
         heapq.heappush(open_set, (0, start))
         
@@ -130,6 +527,8 @@ class FloorPlanNavigator:
     
     def visualize_path(self, path: List[Tuple[int, int]], start_name: str = "Start", 
                       goal_name: str = "Goal", save_path: str = None):
+        import matplotlib.pyplot as plt
+        
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 10))
         
         ax1.imshow(self.map_array, cmap='gray')
@@ -164,10 +563,55 @@ class FloorPlanNavigator:
         
         if save_path:
             plt.savefig(save_path, dpi=150, bbox_inches='tight')
-        plt.show()
+            plt.close(fig)
+        else:
+            plt.show()
         
         return fig
     
+    def has_line_of_sight(self, a: Tuple[int, int], b: Tuple[int, int]) -> bool:
+        """True if every cell on the straight segment from a to b is free in ``inflated_map``."""
+        steps = max(abs(b[0] - a[0]), abs(b[1] - a[1]))
+        xs = np.rint(np.linspace(a[0], b[0], steps + 1)).astype(np.intp)
+        ys = np.rint(np.linspace(a[1], b[1], steps + 1)).astype(np.intp)
+        return not self.inflated_map[ys, xs].any()
+    
+    def simplify_path(self, path: List[Tuple[int, int]], tolerance: float) -> List[Tuple[int, int]]:
+        """Reduce a grid path to its turn points.
+
+        Ramer-Douglas-Peucker with a collision check: a run of the path is
+        replaced by a straight segment only if no point of the run lies more
+        than ``tolerance`` pixels from it and the segment has line of sight.
+        A large tolerance pulls the path taut; a small one keeps its shape
+        (and its distance from the walls) and only drops collinear points.
+        """
+        if not path or len(path) < 3:
+            return list(path) if path else path
+        points = np.asarray(path, dtype=np.float64)
+        keep = np.zeros(len(points), dtype=bool)
+        keep[0] = keep[-1] = True
+        stack = [(0, len(points) - 1)]
+        while stack:
+            first, last = stack.pop()
+            if last - first < 2:
+                continue
+            a, b = points[first], points[last]
+            chord = b - a
+            inner = points[first + 1:last] - a
+            length = np.hypot(chord[0], chord[1])
+            if length:
+                deviation = np.abs(chord[0] * inner[:, 1] - chord[1] * inner[:, 0]) / length
+            else:
+                deviation = np.hypot(inner[:, 0], inner[:, 1])
+            worst = int(np.argmax(deviation))
+            if deviation[worst] <= tolerance and self.has_line_of_sight(path[first], path[last]):
+                continue
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+        return [path[i] for i in np.flatnonzero(keep)]
+    
     def calculate_path_length(self, path: List[Tuple[int, int]]) -> float:
         if not path or len(path) < 2:
             return 0.0
@@ -182,13 +626,13 @@ class FloorPlanNavigator:
         return total_distance
 
 def load_locations(json_path: str) -> Dict:
-    with open(json_path, 'r') as f:
-        return json.load(f)
+    # The file plus the server's change log that has not been compacted into it yet
+    return LocationStore(json_path).all()
 
 def main():
-    navigator = FloorPlanNavigator('floor_plan_config.yaml')
+    navigator = FloorPlanNavigator('floor_plan_updated_config.yaml')
     
-    locations = load_locations('office_locations.json')
+    locations = load_locations('office_locations_updated.json')
     
     print(f"Floor plan dimensions: {navigator.width_meters:.2f}m x {navigator.height_meters:.2f}m")
     print(f"Image dimensions: {navigator.map_array.shape[1]} x {navigator.map_array.shape[0]} pixels")
@@ -196,9 +640,9 @@ def main():
     print()
     
     test_routes = [
-        ("entrance", "conference_room"),
-        ("desk_area_1", "kitchen"),
-        ("meeting_room_1", "desk_area_2"),
+        ("enterance", "david_desk"),
+        ("front_table", "taide_desk"),
+        ("side_table", "beanbag"),
     ]
     
     for start_name, goal_name in test_routes:
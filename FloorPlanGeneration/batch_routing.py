@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from astar_navigation import FloorPlanNavigator
+
+# The navigator of a pool worker, loaded once by the pool initializer
+_navigator = None
+
+
+def _init_worker(config_path: str, server_pid: int, obstacles: Dict[str, np.ndarray]):
+    global _navigator
+    _navigator = FloorPlanNavigator(config_path)
+    for obstacle_id, points in obstacles.items():
+        _navigator.add_obstacle(points, obstacle_id)
+    # A killed server never shuts the pool down, so workers leave on their own
+    threading.Thread(target=_exit_with, args=(server_pid,), daemon=True).start()
+
+
+def _exit_with(server_pid: int):
+    while os.getppid() == server_pid:
+        time.sleep(1)
+    os._exit(0)
+
+
+def route_result(index: int, path, distance: float, planner: str, include_path: bool = True) -> Dict:
+    """One line of a batch response; ``path`` is in pixels like /api/find_path."""
+    if not path:
+        return {'index': index, 'success': False, 'error': 'No path found'}
+    result = {
+        'index': index,
+        'success': True,
+        'distance': round(distance, 2),
+        'waypoints': len(path),
+        'planner': planner,
+    }
+    if include_path:
+        result['path'] = np.asarray(path, dtype=np.int64).tolist()
+    return result
+
+
+def _route_group(goal: Tuple[int, int], starts: List[Tuple[int, Tuple[int, int]]],
+                 planner: str, include_path: bool, tolerance: Optional[float]) -> List[Dict]:
+    results = []
+    for index, start in starts:
+        try:
+            path = _navigator.find_path(start, goal, planner)
+            if path and tolerance is not None:
+                path = _navigator.simplify_path(path, tolerance)
+            distance = _navigator.calculate_path_length(path) if path else 0.0
+            results.append(route_result(index, path, distance, planner, include_path))
+        except Exception as e:
+            results.append({'index': index, 'success': False, 'error': str(e)})
+    return results
+
+
+class BatchRouter:
+    """Routes many start/goal pairs on a pool of worker processes.
+
+    Each worker loads its own ``FloorPlanNavigator`` from the config (fast
+    with ``artifact_dir``) and searches outside the server's GIL. Pairs
+    are grouped by goal and each group goes to one worker; a goal shared
+    by several starts is routed with the ``flow_field`` planner unless a
+    planner is given, so checking every desk against an exit costs one
+    distance field. Results are yielded group by group as they finish.
+
+    Runtime obstacles are passed to the workers when the pool starts;
+    ``set_obstacles`` retires the pool so the next batch starts one with
+    the current set.
+    """
+
+    def __init__(self, config_path: str, default_planner: str = 'astar', workers: Optional[int] = None):
+        self.config_path = config_path
+        self.default_planner = default_planner
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self._executor = None
+        self._obstacles: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the server's threads and locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.config_path, os.getpid(), self._obstacles))
+            return self._executor
+
+    def route(self, pairs: List[Tuple[int, Tuple[int, int], Tuple[int, int]]],
+              planner: Optional[str] = None, include_path: bool = True,
+              tolerance: Optional[float] = None) -> Iterator[Dict]:
+        """Yield a result per ``(index, start, goal)`` pair in completion order.
+
+        With a ``tolerance`` in pixels paths are reduced by ``simplify_path``.
+        """
+        groups = OrderedDict()
+        for index, start, goal in pairs:
+            groups.setdefault(tuple(goal), []).append((index, tuple(start)))
+
+        executor = self.executor
+        futures = {}
+        for goal, starts in groups.items():
+            group_planner = planner or ('flow_field' if len(starts) > 1 else self.default_planner)
+            future = executor.submit(_route_group, goal, starts, group_planner, include_path, tolerance)
+            futures[future] = starts
+
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield from future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        self._discard(executor)
+                    for index, _ in futures[future]:
+                        yield {'index': index, 'success': False, 'error': str(e) or type(e).__name__}
+        finally:
+            # A client that disconnects should not keep the pool busy
+            for future in futures:
+                future.cancel()
+
+    def memory_bytes(self) -> int:
+        """Resident memory of the pool's worker processes (Linux; 0 elsewhere or without a pool)."""
+        with self._lock:
+            executor = self._executor
+        # The pool does not expose its processes otherwise
+        processes = getattr(executor, '_processes', None) or {}
+        page = os.sysconf('SC_PAGE_SIZE')
+        total = 0
+        for pid in list(processes):
+            try:
+                with open(f'/proc/{pid}/statm') as f:
+                    total += int(f.read().split()[1]) * page
+            except (OSError, ValueError, IndexError):
+                continue
+        return total
+
+    def set_obstacles(self, obstacles: Dict[str, np.ndarray]):
+        """Route later batches around ``obstacles`` (id to pixel polygon)."""
+        with self._lock:
+            self._obstacles = {obstacle_id: np.array(points) for obstacle_id, points in obstacles.items()}
+            executor = self._executor
+        if executor is not None:
+            self._discard(executor)
+
+    def close(self):
+        """Shut the pool down; a later batch starts a new one."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Routing benchmark over the real floor plan with regression gates.
+
+Runs every valid pair of saved locations plus seeded random pairs of
+connected free cells through each planner and reports, per planner,
+p50/p95 latency, cells expanded, peak traced memory and path cost
+relative to A* (the optimum). Results are written as JSON; with
+``--baseline`` the run fails when a metric regresses by more than the
+``benchmark_thresholds`` in the config.
+
+    python3 benchmark_routing.py --output results.json
+    python3 benchmark_routing.py --baseline results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from itertools import combinations
+
+import numpy as np
+
+from astar_navigation import FloorPlanNavigator, PLANNERS, load_locations
+
+CONFIG_FILE = 'floor_plan_updated_config.yaml'
+LOCATIONS_FILE = 'office_locations_updated.json'
+
+# A metric regresses when it exceeds baseline * (1 + threshold)
+DEFAULT_THRESHOLDS = {'latency': 0.25, 'expanded': 0.05, 'memory': 0.25, 'cost': 0.01}
+GATED_METRICS = (('p50_ms', 'latency'), ('p95_ms', 'latency'), ('expanded_mean', 'expanded'),
+                 ('peak_memory_mb', 'memory'), ('cost_ratio_mean', 'cost'))
+
+
+def location_pairs(navigator, locations):
+    cells = {name: navigator.meters_to_pixels(loc['x'], loc['y']) for name, loc in locations.items()}
+    valid = {name: cell for name, cell in cells.items() if navigator.is_valid_position(*cell)}
+    for name in sorted(set(cells) - set(valid)):
+        print(f"Skipping location {name}: {cells[name]} is not a valid position")
+    return [(f"{a} -> {b}", valid[a], valid[b]) for a, b in combinations(sorted(valid), 2)]
+
+
+def random_pairs(navigator, count, seed):
+    """Pairs of free cells drawn from the largest 8-connected free region."""
+    import cv2
+    free = (navigator.inflated_map == 0).astype(np.uint8)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(free, connectivity=8)
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    ys, xs = np.nonzero(labels == largest)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(xs), size=(count, 2))
+    return [(f"random {i}", (int(xs[a]), int(ys[a])), (int(xs[b]), int(ys[b])))
+            for i, (a, b) in enumerate(picks)]
+
+
+def engine_of(navigator, planner):
+    """The engine whose ``expanded`` counter describes the planner, if any."""
+    return {'astar': navigator.grid_astar, 'bidirectional': navigator.bidirectional,
+            'jps': navigator.jump_point}.get(planner)
+
+
+def run_planner(navigator, planner, pairs, reference, memory_pairs):
+    engine = engine_of(navigator, planner)
+    latencies, expanded, lengths, ratios = [], [], [], []
+    found = mismatches = 0
+    for label, start, goal in pairs:
+        started = time.perf_counter()
+        path = navigator.find_path(start, goal, planner)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if engine is not None:
+            expanded.append(engine.expanded)
+        if (path is None) != (reference.get(label) is None):
+            mismatches += 1
+        if path:
+            found += 1
+            lengths.append(navigator.calculate_path_length(path))
+            optimum = reference.get(label)
+            if optimum:
+                ratios.append(navigator.path_cost(path) / optimum)
+
+    # Tracing slows the search loops down, so memory gets its own pass
+    peak = 0
+    for _, start, goal in pairs[:memory_pairs]:
+        tracemalloc.start()
+        navigator.find_path(start, goal, planner)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        'routes': len(pairs),
+        'found': found,
+        'mismatches': mismatches,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'mean_ms': round(float(np.mean(latencies)), 2),
+        'expanded_mean': round(float(np.mean(expanded)), 1) if expanded else None,
+        'peak_memory_mb': round(peak / (1024 * 1024), 2),
+        'mean_length_m': round(float(np.mean(lengths)), 3) if lengths else None,
+        'cost_ratio_mean': round(float(np.mean(ratios)), 4) if ratios else None,
+        'cost_ratio_max': round(float(np.max(ratios)), 4) if ratios else None,
+    }
+
+
+def regressions(results, baseline, thresholds):
+    """Describe every gated metric that got worse than the baseline allows."""
+    failures = []
+    for planner, current in results['planners'].items():
+        previous = baseline.get('planners', {}).get(planner)
+        if previous is None:
+            continue
+        if current['mismatches'] > previous['mismatches']:
+            failures.append(f"{planner}: mismatches {previous['mismatches']} -> {current['mismatches']}")
+        for metric, kind in GATED_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + thresholds[kind]):
+                failures.append(f"{planner}: {metric} {old} -> {new} (allowed +{thresholds[kind]:.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default=CONFIG_FILE)
+    parser.add_argument('--locations', default=LOCATIONS_FILE)
+    parser.add_argument('--planners', nargs='+', choices=PLANNERS,
+                        default=[p for p in PLANNERS if p != 'astar_legacy'])
+    parser.add_argument('--random', type=int, default=10, help='number of random pairs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-pairs', type=int, help='cap on the total number of pairs')
+    parser.add_argument('--memory-pairs', type=int, default=2, help='pairs traced for peak memory')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='results file to gate against')
+    args = parser.parse_args()
+    if args.baseline and os.path.realpath(args.baseline) == os.path.realpath(args.output):
+        parser.error('--output must not overwrite the --baseline file')
+
+    navigator = FloorPlanNavigator(args.config)
+    pairs = location_pairs(navigator, load_locations(args.locations))
+    pairs += random_pairs(navigator, args.random, args.seed)
+    pairs = pairs[:args.max_pairs]
+    print(f"Benchmarking {len(pairs)} pairs with {', '.join(args.planners)}")
+
+    # Build every engine (and the HPA* graph) before anything is timed
+    for planner in args.planners:
+        navigator.find_path(pairs[0][1], pairs[0][1], planner)
+
+    reference = {}
+    for label, start, goal in pairs:
+        path = navigator.find_path(start, goal, 'astar')
+        reference[label] = navigator.path_cost(path) if path else None
+
+    results = {
+        'meta': {
+            'config': args.config,
+            'map_signature': navigator.map_signature,
+            'pairs': len(pairs),
+            'random_pairs': args.random,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'planners': {},
+    }
+    for planner in args.planners:
+        stats = run_planner(navigator, planner, pairs, reference, args.memory_pairs)
+        results['planners'][planner] = stats
+        print(f"{planner:<14} p50 {stats['p50_ms']:>9.1f}ms  p95 {stats['p95_ms']:>9.1f}ms  "
+              f"expanded {stats['expanded_mean'] if stats['expanded_mean'] is not None else '-':>10}  "
+              f"peak {stats['peak_memory_mb']:>7.1f}MB  cost x{stats['cost_ratio_mean']}  "
+              f"found {stats['found']}/{stats['routes']}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('map_signature') != navigator.map_signature:
+            print("Warning: baseline was recorded for a different map or settings")
+        thresholds = dict(DEFAULT_THRESHOLDS, **navigator.config.get('benchmark_thresholds', {}))
+        failures = regressions(results, baseline, thresholds)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
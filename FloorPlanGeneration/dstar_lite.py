@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+import heapq
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+INF = float('inf')
+# Fields are float32, so g/rhs agreement is checked with a small tolerance
+EPSILON = 1e-2
+
+
+class DStarLite:
+    """D* Lite state for one user walking toward a fixed goal.
+
+    The search runs backward from the goal, so its values stay valid while
+    the start moves; a position update only bumps ``km`` and repairs
+    whatever became inconsistent. Instead of growing the solution from
+    scratch, g and rhs start from the goal's exact distance field, which
+    makes the initial state consistent everywhere. Only cells touched by
+    later map changes are tracked in the sparse override dicts.
+
+    A repair that needs more than ``max_repair`` expansions (for example a
+    blocked corridor that invalidates half the map) reseeds from a fresh
+    field via ``field_source`` instead, which is cheaper at that size. So
+    does an update touching more than ``max_repair`` cells, lazily on the
+    next ``plan_from``.
+    """
+
+    def __init__(self, navigator, goal: Tuple[int, int], field_source: Callable,
+                 max_repair: int = 20000):
+        self.navigator = navigator
+        self.engine = navigator.grid_astar
+        self.goal = (int(goal[0]), int(goal[1]))
+        self.goal_i = self.engine.to_index(*self.goal)
+        self.moves = [(move[0], move[3]) for move in self.engine.moves]
+        self.clearance = self.engine.clearance
+        self.half = self.engine.half_scale
+        self.field_source = field_source
+        self.max_repair = int(max_repair)
+        self.start_i: Optional[int] = None
+        self.lock = threading.Lock()
+        self._seed()
+
+    def _seed(self):
+        self.stale = False
+        self.base = memoryview(self.field_source(self.goal))
+        self.blocked = self.engine.blocked
+        self.g_over: Dict[int, float] = {}
+        self.rhs_over: Dict[int, float] = {}
+        self.open_set: List[Tuple[float, float, int]] = []
+        self.open_keys: Dict[int, Tuple[float, float]] = {}
+        self.km = 0.0
+        self.last_path: Optional[List[Tuple[int, int]]] = None
+        self._path_index: Optional[Dict[Tuple[int, int], int]] = None
+
+    def _g(self, s: int) -> float:
+        value = self.g_over.get(s)
+        return self.base[s] if value is None else value
+
+    def _rhs(self, s: int) -> float:
+        value = self.rhs_over.get(s)
+        return self.base[s] if value is None else value
+
+    def _h(self, s: int) -> float:
+        ax, ay = divmod(self.start_i, self.engine.stride)
+        bx, by = divmod(s, self.engine.stride)
+        return self.navigator.heuristic(ax, ay, bx, by)
+
+    def _key(self, s: int) -> Tuple[float, float]:
+        value = min(self._g(s), self._rhs(s))
+        return (value + self._h(s) + self.km, value)
+
+    def _update_vertex(self, u: int):
+        blocked = self.blocked
+        if u != self.goal_i:
+            best = INF
+            if not blocked[u]:
+                clearance, half = self.clearance, self.half
+                here = half[clearance[u]]
+                for offset, cost in self.moves:
+                    v = u + offset
+                    if not blocked[v]:
+                        candidate = cost * (here + half[clearance[v]]) + self._g(v)
+                        if candidate < best:
+                            best = candidate
+            self.rhs_over[u] = best
+        self.open_keys.pop(u, None)
+        g, rhs = self._g(u), self._rhs(u)
+        if not (g == rhs or abs(g - rhs) <= EPSILON):
+            key = self._key(u)
+            self.open_keys[u] = key
+            heapq.heappush(self.open_set, (key[0], key[1], u))
+
+    def _compute_shortest_path(self) -> bool:
+        """Repair inconsistent cells; False if the expansion budget ran out."""
+        start = self.start_i
+        expansions = 0
+        while self.open_set:
+            k1, k2, u = self.open_set[0]
+            if self.open_keys.get(u) != (k1, k2):
+                heapq.heappop(self.open_set)
+                continue
+            # Ties with the start key are expanded too: float32 rounding
+            # must not leave an equally short detour unprocessed
+            if k1 > self._key(start)[0] + EPSILON and self._rhs(start) <= self._g(start) + EPSILON:
+                break
+
+            expansions += 1
+            if expansions > self.max_repair:
+                return False
+            heapq.heappop(self.open_set)
+            del self.open_keys[u]
+            new_key = self._key(u)
+            if (k1, k2) < new_key:
+                self.open_keys[u] = new_key
+                heapq.heappush(self.open_set, (new_key[0], new_key[1], u))
+            elif self._g(u) > self._rhs(u):
+                self.g_over[u] = self._rhs(u)
+                for offset, _ in self.moves:
+                    self._update_vertex(u + offset)
+            else:
+                self.g_over[u] = INF
+                self._update_vertex(u)
+                for offset, _ in self.moves:
+                    self._update_vertex(u + offset)
+        return True
+
+    def update_cells(self, cells: Sequence[Tuple[int, int]]):
+        """Queue repairs after occupancy or clearance changed at ``cells``."""
+        with self.lock:
+            self.blocked = self.engine.blocked
+            self.last_path = None
+            self._path_index = None
+            if self.stale or len(cells) > self.max_repair:
+                self.stale = True
+                return
+            touched = set()
+            for x, y in cells:
+                i = self.engine.to_index(x, y)
+                touched.add(i)
+                touched.update(i + offset for offset, _ in self.moves)
+            for i in touched:
+                self._update_vertex(i)
+
+    def plan_from(self, start: Tuple[int, int]) -> Optional[List[Tuple[int, int]]]:
+        """Move the start to ``start`` and return the repaired path to the goal."""
+        with self.lock:
+            if self.stale:
+                self._seed()
+            start_i = self.engine.to_index(int(start[0]), int(start[1]))
+            if self.start_i is not None and start_i != self.start_i:
+                self.km += self._h(start_i)
+            self.start_i = start_i
+
+            if self.open_set:
+                if not self._compute_shortest_path():
+                    print(f"D* Lite repair over budget, reseeding goal {self.goal}")
+                    self._seed()
+                self.last_path = None
+                self._path_index = None
+
+            # Extraction is deterministic, so a start on the previous path
+            # just takes its suffix
+            if self.last_path is not None:
+                if self._path_index is None:
+                    self._path_index = {cell: i for i, cell in enumerate(self.last_path)}
+                index = self._path_index.get((int(start[0]), int(start[1])))
+                if index is not None:
+                    return self.last_path[index:]
+
+            path = self._extract_path()
+            self.last_path = path
+            self._path_index = None
+            return path
+
+    def _extract_path(self) -> Optional[List[Tuple[int, int]]]:
+        current = self.start_i
+        if self._g(current) == INF:
+            return None
+        blocked = self.blocked
+        clearance, half = self.clearance, self.half
+        path = [self.engine.to_cell(current)]
+        limit = len(blocked)
+        while current != self.goal_i:
+            best = current
+            best_value = INF
+            here = half[clearance[current]]
+            for offset, cost in self.moves:
+                v = current + offset
+                if blocked[v]:
+                    continue
+                value = cost * (here + half[clearance[v]]) + self._g(v)
+                if value < best_value:
+                    best = v
+                    best_value = value
+            if best_value == INF or len(path) > limit:
+                return None
+            current = best
+            path.append(self.engine.to_cell(current))
+        return path
+
+
+class NavigationSessions:
+    """Per-user D* Lite sessions with idle expiry.
+
+    Expired sessions are swept whenever a session is created or looked up,
+    and the oldest idle session is dropped once ``max_sessions`` is reached
+    or once the sessions' distance fields exceed the flow field cache's
+    byte bound.
+    """
+
+    def __init__(self, navigator, idle_timeout: float = 300.0, max_sessions: int = 64,
+                 max_repair: int = 20000):
+        self.navigator = navigator
+        self.idle_timeout = float(idle_timeout)
+        self.max_sessions = max(1, int(max_sessions))
+        self.max_repair = max_repair
+        self._sessions: Dict[str, Tuple[DStarLite, float]] = {}
+        self._lock = threading.Lock()
+
+    def _sweep(self, now: float):
+        expired = [sid for sid, (_, seen) in self._sessions.items() if now - seen > self.idle_timeout]
+        for sid in expired:
+            del self._sessions[sid]
+
+    def create(self, goal: Tuple[int, int]) -> str:
+        planner = DStarLite(self.navigator, goal, self._field, max_repair=self.max_repair)
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        fields = self.navigator.flow_fields
+        with self._lock:
+            self._sweep(now)
+            while len(self._sessions) >= self.max_sessions:
+                self._drop_oldest()
+            while self._sessions and fields.held_bytes() > fields.max_bytes:
+                self._drop_oldest()
+            self._sessions[session_id] = (planner, now)
+        return session_id
+
+    def _field(self, goal: Tuple[int, int]):
+        """The goal's field, counted against the flow field cache while the session keeps it."""
+        fields = self.navigator.flow_fields
+        return fields.hold(fields.field(goal))
+
+    def _drop_oldest(self):
+        oldest = min(self._sessions, key=lambda sid: self._sessions[sid][1])
+        del self._sessions[oldest]
+
+    def get(self, session_id: str) -> Optional[DStarLite]:
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], now)
+            return entry[0]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def all(self) -> List[DStarLite]:
+        with self._lock:
+            return [planner for planner, _ in self._sessions.values()]
+
+    def update_cells(self, cells: Sequence[Tuple[int, int]]):
+        """Repair every session after a map change at ``cells``."""
+        for planner in self.all():
+            planner.update_cells(cells)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import threading
+import weakref
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+def distance_field(engine, goal: Tuple[int, int]) -> np.ndarray:
+    """Exact grid distance from every cell to ``goal``, as float32.
+
+    Uses the padded column-major layout of ``engine`` (a GridAStar). The
+    search is a vectorized bucket Dijkstra: with buckets as wide as the
+    cheapest move, every cell in the lowest bucket is final, so a whole
+    wavefront is settled and relaxed per NumPy step. Steps carry the
+    engine's clearance scaling, which never makes them cheaper than the
+    bucket width. Unreachable and occupied cells stay at ``inf``.
+    """
+    blocked = np.frombuffer(engine.blocked, dtype=np.uint8).astype(bool)
+    clearance = np.frombuffer(engine.clearance, dtype=np.uint8)
+    half = np.asarray(engine.half_scale, dtype=np.float64)
+    offsets = np.array([move[0] for move in engine.moves], dtype=np.int64)
+    costs = np.array([move[3] for move in engine.moves], dtype=np.float64)
+    bucket_width = costs.min()
+
+    dist = np.full(blocked.size, np.inf)
+    done = np.zeros(blocked.size, dtype=bool)
+    source = engine.to_index(int(goal[0]), int(goal[1]))
+    dist[source] = 0.0
+    pending = np.array([source], dtype=np.int64)
+
+    while pending.size:
+        pending_dist = dist[pending]
+        settled = pending_dist < pending_dist.min() + bucket_width
+        current = pending[settled]
+        pending = pending[~settled]
+        done[current] = True
+
+        neighbors = (current[:, None] + offsets).ravel()
+        scale = half[clearance[current]][:, None] + half[clearance[neighbors]].reshape(-1, costs.size)
+        candidate = (dist[current][:, None] + costs * scale).ravel()
+        better = ~blocked[neighbors] & ~done[neighbors] & (candidate < dist[neighbors])
+        neighbors = neighbors[better]
+        candidate = candidate[better]
+        if neighbors.size:
+            # Keep the cheapest candidate per neighbour
+            order = np.lexsort((candidate, neighbors))
+            neighbors = neighbors[order]
+            candidate = candidate[order]
+            first = np.ones(neighbors.size, dtype=bool)
+            first[1:] = neighbors[1:] != neighbors[:-1]
+            dist[neighbors[first]] = candidate[first]
+            pending = np.union1d(pending, neighbors[first])
+
+    return dist.astype(np.float32)
+
+
+class FlowFieldCache:
+    """LRU cache of per-goal distance fields.
+
+    Each field answers "distance to the goal" for any cell in O(1) and
+    yields a route from any start by descending the field, so navigators
+    heading to the same goal share one search. The cache is bounded both
+    by entry count and by total bytes.
+
+    Fields that outlive their cache entry (navigation sessions keep their
+    goal's field) are registered with ``hold`` and count against the byte
+    bound until their last reference is gone.
+    """
+
+    def __init__(self, navigator, max_fields: int = 8, max_bytes: int = 256 * 1024 * 1024):
+        self.navigator = navigator
+        self.max_fields = max(1, int(max_fields))
+        self.max_bytes = int(max_bytes)
+        self._fields = OrderedDict()
+        self._held = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def field(self, goal: Tuple[int, int], stats: Optional[dict] = None) -> np.ndarray:
+        """The goal's distance field; ``stats['cache_hit']`` records whether
+        it came from the cache."""
+        goal = (int(goal[0]), int(goal[1]))
+        if stats is not None:
+            stats['cache_hit'] = True
+        with self._lock:
+            cached = self._fields.get(goal)
+            if cached is not None:
+                self._fields.move_to_end(goal)
+                self.hits += 1
+                return cached
+
+        # One computation at a time; a concurrent request for the same goal
+        # waits here and then finds the finished field in the cache
+        with self._compute_lock:
+            with self._lock:
+                cached = self._fields.get(goal)
+                if cached is not None:
+                    self._fields.move_to_end(goal)
+                    self.hits += 1
+                    return cached
+                self.misses += 1
+            if stats is not None:
+                stats['cache_hit'] = False
+            field = distance_field(self.navigator.grid_astar, goal)
+            with self._lock:
+                self._fields[goal] = field
+                self._evict()
+            return field
+
+    def hold(self, field: np.ndarray) -> np.ndarray:
+        """Count ``field`` against the byte bound while anything references it."""
+        with self._lock:
+            self._held[id(field)] = field
+            self._evict()
+        return field
+
+    def held_bytes(self) -> int:
+        with self._lock:
+            return sum(f.nbytes for f in self._held.values())
+
+    def _used(self) -> int:
+        fields = {id(f): f for f in self._fields.values()}
+        fields.update(self._held.items())
+        return sum(f.nbytes for f in fields.values())
+
+    def _evict(self):
+        used = self._used()
+        while len(self._fields) > 1 and (len(self._fields) > self.max_fields or used > self.max_bytes):
+            _, field = self._fields.popitem(last=False)
+            if id(field) not in self._held:
+                used -= field.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._fields.clear()
+
+    def invalidate(self, x0: int, y0: int, x1: int, y1: int) -> int:
+        """Drop the fields that reach ``[x0, x1) x [y0, y1)`` or its border.
+
+        A goal whose field is infinite all around the changed cells cannot
+        route through them, before or after the change. Waits for a field
+        being computed, so it is checked too. Returns the number dropped.
+        """
+        stride = self.navigator.grid_astar.stride
+        with self._compute_lock, self._lock:
+            stale = [goal for goal, field in self._fields.items()
+                     if np.isfinite(field.reshape(-1, stride)[x0:x1 + 2, y0:y1 + 2]).any()]
+            for goal in stale:
+                del self._fields[goal]
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'fields': len(self._fields),
+                'bytes': self._used(),
+                'held_bytes': sum(f.nbytes for f in self._held.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def distance(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[float]:
+        """Remaining distance in meters from start to goal, None if unreachable."""
+        nav = self.navigator
+        engine = nav.grid_astar
+        value = float(self.field(goal)[engine.to_index(int(start[0]), int(start[1]))])
+        if not np.isfinite(value):
+            return None
+        if nav.clearance_weight:
+            # Field values include the clearance penalty, so measure the route
+            return nav.calculate_path_length(self.find_path(start, goal))
+        return value * nav.resolution
+
+    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int],
+                  stats: Optional[dict] = None) -> Optional[List[Tuple[int, int]]]:
+        """Follow the steepest descent of the goal's field from start."""
+        engine = self.navigator.grid_astar
+        field = self.field(goal, stats)
+        current = engine.to_index(int(start[0]), int(start[1]))
+        goal_i = engine.to_index(int(goal[0]), int(goal[1]))
+        if not np.isfinite(field[current]):
+            return None
+
+        moves = [(move[0], move[3]) for move in engine.moves]
+        values = memoryview(field)
+        clearance = engine.clearance
+        half = engine.half_scale
+        path = [engine.to_cell(current)]
+        while current != goal_i:
+            # The neighbour minimising field + step cost is the Dijkstra parent
+            best = current
+            best_value = np.inf
+            here = half[clearance[current]]
+            for offset, cost in moves:
+                value = values[current + offset] + cost * (here + half[clearance[current + offset]])
+                if value < best_value:
+                    best = current + offset
+                    best_value = value
+            current = best
+            path.append(engine.to_cell(current))
+        return path
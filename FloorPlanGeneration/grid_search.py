@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+
+import heapq
+import threading
+import numpy as np
+from typing import List, Tuple, Optional
+
+
+def half_scale_table(clearance_weight: float) -> List[float]:
+    """Per-cost half step scale: ``(1 + clearance_weight * cost / 252) / 2``.
+
+    Indexed by the navigator's uint8 ``costmap``; a step between cells
+    ``a`` and ``b`` costs ``cost * (table[a] + table[b])``.
+    """
+    return [0.5 + 0.5 * clearance_weight * c / 252 for c in range(256)]
+
+
+class GridAStar:
+    """A* over flat cell indices with preallocated NumPy search buffers.
+
+    Cells are stored column-major on a grid padded with a one-cell obstacle
+    border, so ``index = (x + 1) * stride + (y + 1)``. The padding removes
+    bounds checks from the inner loop, and column-major order makes heap
+    ties break exactly like the legacy ``(f, (x, y))`` entries, so both
+    engines return identical paths.
+
+    Each step is scaled by the clearance of the two cells it joins: the
+    navigator's uint8 ``costmap`` is kept in the same padded layout and
+    looked up through ``half_scale``, a 256-entry table of
+    ``(1 + clearance_weight * cost / 252) / 2``. A step from ``a`` to
+    ``b`` costs ``cost * (half_scale[a] + half_scale[b])``, symmetric so
+    backward searches and distance fields agree, and exactly ``cost`` when
+    ``clearance_weight`` is 0.
+
+    ``blocked`` and ``clearance`` are bytearrays patched in place by
+    ``update_region``, so engines, flow fields and D* Lite sessions that
+    hold them see runtime obstacles without a rebuild.
+    """
+
+    def __init__(self, navigator, shared: Optional['GridAStar'] = None):
+        # ``shared`` lends its occupancy bytes, buffers and lock to this engine
+        self.navigator = navigator
+        self.shared = shared
+        self._lock = shared._lock if shared is not None else threading.Lock()
+        self.rebuild()
+
+    def rebuild(self):
+        """Refresh the occupancy bytes and buffers from ``inflated_map``."""
+        if self.shared is not None:
+            for name in ('stride', 'blocked', 'clearance', 'half_scale', 'g_score', 'parent', 'closed', 'moves'):
+                setattr(self, name, getattr(self.shared, name))
+            return
+
+        nav = self.navigator
+        height, width = nav.inflated_map.shape
+        self.stride = height + 2
+
+        padded = np.ones((width + 2, height + 2), dtype=np.uint8)
+        padded[1:-1, 1:-1] = nav.inflated_map.T != 0
+        self.blocked = bytearray(padded.tobytes())
+
+        clearance = np.full((width + 2, height + 2), 254, dtype=np.uint8)
+        clearance[1:-1, 1:-1] = nav.costmap.T
+        self.clearance = bytearray(clearance.tobytes())
+        self.half_scale = half_scale_table(nav.clearance_weight)
+
+        size = padded.size
+        self.g_score = np.empty(size, dtype=np.float64)
+        self.parent = np.empty(size, dtype=np.int32)
+        self.closed = np.zeros(size, dtype=np.uint8)
+
+        s = self.stride
+        moves = [(0, 1, nav.straight_cost), (1, 0, nav.straight_cost),
+                 (0, -1, nav.straight_cost), (-1, 0, nav.straight_cost)]
+        if nav.allow_diagonal:
+            moves.extend([(1, 1, nav.diagonal_cost), (1, -1, nav.diagonal_cost),
+                          (-1, 1, nav.diagonal_cost), (-1, -1, nav.diagonal_cost)])
+        self.moves = [(dx * s + dy, dx, dy, cost) for dx, dy, cost in moves]
+
+    def update_region(self, x0: int, y0: int, x1: int, y1: int):
+        """Copy ``[x0, x1) x [y0, y1)`` of ``inflated_map`` and ``costmap`` into
+        the occupancy and clearance bytes, waiting for running searches."""
+        nav = self.navigator
+        with self._lock:
+            blocked = np.frombuffer(self.blocked, dtype=np.uint8).reshape(-1, self.stride)
+            blocked[x0 + 1:x1 + 1, y0 + 1:y1 + 1] = nav.inflated_map[y0:y1, x0:x1].T != 0
+            clearance = np.frombuffer(self.clearance, dtype=np.uint8).reshape(-1, self.stride)
+            clearance[x0 + 1:x1 + 1, y0 + 1:y1 + 1] = nav.costmap[y0:y1, x0:x1].T
+
+    def to_index(self, x: int, y: int) -> int:
+        return (x + 1) * self.stride + (y + 1)
+
+    def to_cell(self, index: int) -> Tuple[int, int]:
+        px, py = divmod(index, self.stride)
+        return (px - 1, py - 1)
+
+    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int],
+                  weight: float = 1.0, stats: Optional[dict] = None) -> Optional[List[Tuple[int, int]]]:
+        """Search from start to goal; ``weight`` > 1 runs weighted A*.
+
+        Weighted A* inflates the heuristic and returns paths costing at most
+        ``weight`` times the optimum while expanding far fewer cells. When a
+        ``stats`` dict is given it receives the search counters (cells
+        ``expanded``, heap ``pushes`` and ``open_peak``, the largest open set).
+        """
+        with self._lock:
+            path = self._search(start, goal, weight)
+            if stats is not None:
+                stats.update(expanded=self.expanded, pushes=self.pushes, open_peak=self.open_peak)
+            return path
+
+    def _search(self, start, goal, weight):
+        nav = self.navigator
+        s = self.stride
+        start_i = self.to_index(int(start[0]), int(start[1]))
+        goal_i = self.to_index(int(goal[0]), int(goal[1]))
+        gx, gy = divmod(goal_i, s)
+
+        self.g_score.fill(np.inf)
+        self.closed.fill(0)
+        g = memoryview(self.g_score)
+        parent = memoryview(self.parent)
+        closed = memoryview(self.closed)
+        blocked = self.blocked
+        clearance = self.clearance
+        half = self.half_scale
+        moves = self.moves
+
+        diagonal = nav.allow_diagonal
+        straight = nav.straight_cost * weight
+        diag_extra = (nav.diagonal_cost - 2 * nav.straight_cost) * weight
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        g[start_i] = 0
+        open_set = [(0, start_i)]
+        # Every push is popped (expanded or stale) or still queued at the end,
+        # so pushes are counted without touching the inner loop
+        expanded = stale = 0
+        peak = 1
+        found = False
+
+        while open_set:
+            _, current = heappop(open_set)
+            if closed[current]:
+                stale += 1
+                continue
+            closed[current] = 1
+            expanded += 1
+
+            if current == goal_i:
+                found = True
+                break
+
+            g_current = g[current]
+            here = half[clearance[current]]
+            cx, cy = divmod(current, s)
+            for offset, dx, dy, cost in moves:
+                neighbor = current + offset
+                if blocked[neighbor] or closed[neighbor]:
+                    continue
+                tentative_g = g_current + cost * (here + half[clearance[neighbor]])
+                if tentative_g < g[neighbor]:
+                    g[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    hx = gx - cx - dx
+                    hy = gy - cy - dy
+                    if hx < 0:
+                        hx = -hx
+                    if hy < 0:
+                        hy = -hy
+                    if diagonal:
+                        h = straight * (hx + hy) + diag_extra * (hx if hx < hy else hy)
+                    else:
+                        h = (hx + hy) * weight
+                    heappush(open_set, (tentative_g + h, neighbor))
+            if len(open_set) > peak:
+                peak = len(open_set)
+
+        self.expanded, self.pushes, self.open_peak = expanded, expanded + stale + len(open_set), peak
+        return self._reconstruct(start_i, goal_i) if found else None
+
+    def _reconstruct(self, start_i: int, goal_i: int) -> List[Tuple[int, int]]:
+        parent = self.parent
+        path = []
+        current = goal_i
+        while current != start_i:
+            path.append(self.to_cell(current))
+            current = int(parent[current])
+        path.append(self.to_cell(start_i))
+        return path[::-1]
+
+
+class BidirectionalAStar(GridAStar):
+    """A* from both ends at once, meeting in the middle.
+
+    Each side keeps its own g, parent and closed buffers (the forward ones
+    are borrowed from the shared engine) and the side with the smaller open
+    set is expanded next. Whenever a side lowers a cell's g and the other
+    side has reached that cell, the joined cost is a candidate ``best``.
+
+    Both sides use the average potential ``p = (h_goal - h_start) / 2``
+    (octile distances), keyed ``g + p`` forward and ``g - p`` backward.
+    ``p`` is consistent in both directions, so this is bidirectional
+    Dijkstra on non-negative reduced costs, and the search can stop with an
+    optimal path as soon as the two smallest keys sum to ``best``. Plain
+    front-to-end heuristics only allow stopping when one side alone
+    reaches ``best``, which expands more than unidirectional A*.
+    Weighted searches fall back to the unidirectional engine.
+
+    The average potential is only half as informed as the octile
+    heuristic, so on the office map the two frontiers together expand
+    about as many cells as ``GridAStar`` and the benchmark is only about
+    6% faster. The engine is kept for comparison, not recommended.
+    """
+
+    def rebuild(self):
+        super().rebuild()
+        size = len(self.blocked)
+        self.g_back = np.empty(size, dtype=np.float64)
+        self.parent_back = np.empty(size, dtype=np.int32)
+        self.closed_back = np.zeros(size, dtype=np.uint8)
+
+    def _search(self, start, goal, weight):
+        if weight != 1.0:
+            return super()._search(start, goal, weight)
+
+        nav = self.navigator
+        s = self.stride
+        start_i = self.to_index(int(start[0]), int(start[1]))
+        goal_i = self.to_index(int(goal[0]), int(goal[1]))
+        self.expanded = self.pushes = self.open_peak = 0
+        if start_i == goal_i:
+            return [self.to_cell(start_i)]
+
+        for buffer in (self.g_score, self.g_back):
+            buffer.fill(np.inf)
+        self.closed.fill(0)
+        self.closed_back.fill(0)
+        g_fwd = memoryview(self.g_score)
+        g_bwd = memoryview(self.g_back)
+        parent_fwd = memoryview(self.parent)
+        parent_bwd = memoryview(self.parent_back)
+        closed_fwd = memoryview(self.closed)
+        closed_bwd = memoryview(self.closed_back)
+        blocked = self.blocked
+        clearance = self.clearance
+        half = self.half_scale
+        moves = self.moves
+
+        diagonal = nav.allow_diagonal
+        straight = nav.straight_cost
+        diag_extra = nav.diagonal_cost - 2 * nav.straight_cost
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        g_fwd[start_i] = 0
+        g_bwd[goal_i] = 0
+        open_fwd = [(0, start_i)]
+        open_bwd = [(0, goal_i)]
+        sx, sy = divmod(start_i, s)
+        gx, gy = divmod(goal_i, s)
+        forward_side = (open_fwd, g_fwd, parent_fwd, closed_fwd, g_bwd, 0.5)
+        backward_side = (open_bwd, g_bwd, parent_bwd, closed_bwd, g_fwd, -0.5)
+        best = np.inf
+        meet = -1
+        expanded = stale = 0
+        peak = 2
+
+        while open_fwd and open_bwd:
+            if open_fwd[0][0] + open_bwd[0][0] >= best:
+                break
+            side = forward_side if len(open_fwd) <= len(open_bwd) else backward_side
+            open_set, g, parent, closed, g_other, sign = side
+
+            _, current = heappop(open_set)
+            if closed[current]:
+                stale += 1
+                continue
+            closed[current] = 1
+            expanded += 1
+
+            g_current = g[current]
+            here = half[clearance[current]]
+            cx, cy = divmod(current, s)
+            for offset, dx, dy, cost in moves:
+                neighbor = current + offset
+                if blocked[neighbor] or closed[neighbor]:
+                    continue
+                tentative_g = g_current + cost * (here + half[clearance[neighbor]])
+                if tentative_g < g[neighbor]:
+                    g[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    joined = tentative_g + g_other[neighbor]
+                    if joined < best:
+                        best = joined
+                        meet = neighbor
+                    nx = cx + dx
+                    ny = cy + dy
+                    hx = gx - nx if gx > nx else nx - gx
+                    hy = gy - ny if gy > ny else ny - gy
+                    ex = sx - nx if sx > nx else nx - sx
+                    ey = sy - ny if sy > ny else ny - sy
+                    if diagonal:
+                        h = (straight * (hx + hy - ex - ey)
+                             + diag_extra * ((hx if hx < hy else hy) - (ex if ex < ey else ey)))
+                    else:
+                        h = hx + hy - ex - ey
+                    heappush(open_set, (tentative_g + sign * h, neighbor))
+            if len(open_fwd) + len(open_bwd) > peak:
+                peak = len(open_fwd) + len(open_bwd)
+
+        remaining = len(open_fwd) + len(open_bwd)
+        self.expanded, self.pushes, self.open_peak = expanded, expanded + stale + remaining, peak
+        if meet == -1:
+            return None
+        return self._reconstruct_meeting(start_i, goal_i, meet)
+
+    def _reconstruct_meeting(self, start_i: int, goal_i: int, meet: int) -> List[Tuple[int, int]]:
+        path = self._reconstruct(start_i, meet)
+        current = meet
+        while current != goal_i:
+            current = int(self.parent_back[current])
+            path.append(self.to_cell(current))
+        return path
+
+
+class JumpPointSearch(GridAStar):
+    """Jump Point Search on the uniform-cost 8-connected grid.
+
+    Long straight and diagonal runs are scanned without pushing every cell
+    onto the open set; only jump points (cells with forced neighbours, or
+    the goal) are expanded. Like the base grid, diagonal moves only need
+    the target cell to be free, which matches ``get_neighbors``. Paths have
+    the same cost as A* and are expanded back to one-pixel steps. Without
+    diagonal moves, or with clearance costs (which make the grid non-uniform),
+    the search falls back to plain A*.
+    """
+
+    def _search(self, start, goal, weight):
+        nav = self.navigator
+        if not nav.allow_diagonal or nav.clearance_weight:
+            return super()._search(start, goal, weight)
+
+        s = self.stride
+        start_i = self.to_index(int(start[0]), int(start[1]))
+        goal_i = self.to_index(int(goal[0]), int(goal[1]))
+        gx, gy = divmod(goal_i, s)
+
+        self.g_score.fill(np.inf)
+        self.closed.fill(0)
+        g = memoryview(self.g_score)
+        parent = memoryview(self.parent)
+        closed = memoryview(self.closed)
+        blocked = self.blocked
+
+        straight = nav.straight_cost
+        diagonal = nav.diagonal_cost
+        h_straight = straight * weight
+        h_extra = (diagonal - 2 * straight) * weight
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        def jump_straight(n, dx, dy):
+            # Scan along a row (dx) or column (dy) until a jump point or wall
+            step = dx * s + dy
+            side = 1 if dx else s
+            while True:
+                n += step
+                if blocked[n]:
+                    return -1
+                if n == goal_i:
+                    return n
+                if (blocked[n + side] and not blocked[n + side + step]) or \
+                        (blocked[n - side] and not blocked[n - side + step]):
+                    return n
+
+        def jump_diagonal(n, dx, dy):
+            step = dx * s + dy
+            while True:
+                n += step
+                if blocked[n]:
+                    return -1
+                if n == goal_i:
+                    return n
+                if (blocked[n - dx * s] and not blocked[n - dx * s + dy]) or \
+                        (blocked[n - dy] and not blocked[n + dx * s - dy]):
+                    return n
+                if jump_straight(n, dx, 0) != -1 or jump_straight(n, 0, dy) != -1:
+                    return n
+
+        all_directions = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+        g[start_i] = 0
+        parent[start_i] = start_i
+        open_set = [(0, start_i)]
+        # Every push is popped (expanded or stale) or still queued at the end,
+        # so pushes are counted without touching the inner loop
+        expanded = stale = 0
+        peak = 1
+        found = False
+
+        while open_set:
+            _, current = heappop(open_set)
+            if closed[current]:
+                stale += 1
+                continue
+            closed[current] = 1
+            expanded += 1
+
+            if current == goal_i:
+                found = True
+                break
+
+            cx, cy = divmod(current, s)
+            if current == start_i:
+                directions = all_directions
+            else:
+                px, py = divmod(parent[current], s)
+                dx = (cx > px) - (cx < px)
+                dy = (cy > py) - (cy < py)
+                if dx and dy:
+                    directions = [(dx, 0), (0, dy), (dx, dy)]
+                    if blocked[current - dx * s]:
+                        directions.append((-dx, dy))
+                    if blocked[current - dy]:
+                        directions.append((dx, -dy))
+                elif dx:
+                    directions = [(dx, 0)]
+                    if blocked[current + 1]:
+                        directions.append((dx, 1))
+                    if blocked[current - 1]:
+                        directions.append((dx, -1))
+                else:
+                    directions = [(0, dy)]
+                    if blocked[current + s]:
+                        directions.append((1, dy))
+                    if blocked[current - s]:
+                        directions.append((-1, dy))
+
+            g_current = g[current]
+            for dx, dy in directions:
+                if dx and dy:
+                    jump = jump_diagonal(current, dx, dy)
+                else:
+                    jump = jump_straight(current, dx, dy)
+                if jump == -1 or closed[jump]:
+                    continue
+                jx, jy = divmod(jump, s)
+                steps = abs(jx - cx) or abs(jy - cy)
+                tentative_g = g_current + steps * (diagonal if dx and dy else straight)
+                if tentative_g < g[jump]:
+                    g[jump] = tentative_g
+                    parent[jump] = current
+                    hx = abs(gx - jx)
+                    hy = abs(gy - jy)
+                    h = h_straight * (hx + hy) + h_extra * (hx if hx < hy else hy)
+                    heappush(open_set, (tentative_g + h, jump))
+            if len(open_set) > peak:
+                peak = len(open_set)
+
+        self.expanded, self.pushes, self.open_peak = expanded, expanded + stale + len(open_set), peak
+        return self._reconstruct_jumps(start_i, goal_i) if found else None
+
+    def _reconstruct_jumps(self, start_i: int, goal_i: int) -> List[Tuple[int, int]]:
+        jumps = [goal_i]
+        while jumps[-1] != start_i:
+            jumps.append(int(self.parent[jumps[-1]]))
+        jumps.reverse()
+
+        path = [self.to_cell(start_i)]
+        for a, b in zip(jumps, jumps[1:]):
+            ax, ay = self.to_cell(a)
+            bx, by = self.to_cell(b)
+            dx = (bx > ax) - (bx < ax)
+            dy = (by > ay) - (by < ay)
+            for k in range(1, max(abs(bx - ax), abs(by - ay)) + 1):
+                path.append((ax + k * dx, ay + k * dy))
+        return path
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+import heapq
+import time
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from grid_search import half_scale_table
+
+START_NODE = -1
+GOAL_NODE = -2
+
+
+class HierarchicalPlanner:
+    """HPA*-style planner over square clusters of the inflated map.
+
+    At build time the grid is cut into ``cluster_size`` pixel clusters.
+    Every free run along a shared cluster border gets entrance nodes spaced
+    at most ``entrance_spacing`` pixels apart, and a local Dijkstra inside
+    each cluster connects its entrances. The refined pixel path of every
+    intra-cluster edge is kept, so a query only searches the start and goal
+    clusters at full resolution, runs A* over the small abstract graph and
+    concatenates the stored segments.
+
+    Abstract paths are accepted when they cost at most ``suboptimality``
+    times a lower bound on the optimal cost; otherwise the query falls back
+    to weighted A* with the same weight, so every returned path stays within
+    the bound. The lower bound is the octile distance scaled by the cheapest
+    step cost anywhere on the free map, which is 1 without clearance costs.
+    When the abstract graph has no route the query also falls back to
+    weighted A*, which covers clusters that only touch diagonally.
+
+    With an ``artifacts`` store the built graph is saved after the first
+    build and reloaded on later starts with the same map signature. After
+    a runtime map change a new planner is built from the ``previous`` one,
+    reusing the edges of every cluster outside the ``dirty`` region whose
+    entrances did not move.
+    """
+
+    def __init__(self, navigator, cluster_size: int = 64, entrance_spacing: int = 64,
+                 suboptimality: float = 1.25, artifacts=None,
+                 previous: Optional['HierarchicalPlanner'] = None,
+                 dirty: Optional[Tuple[int, int, int, int]] = None):
+        self.navigator = navigator
+        self.cluster_size = int(cluster_size)
+        self.entrance_spacing = max(1, int(entrance_spacing))
+        self.suboptimality = float(suboptimality)
+        self.artifacts = artifacts
+        self.half_scale = half_scale_table(navigator.clearance_weight)
+        if previous is not None:
+            self.update(previous, dirty)
+        elif not self.load():
+            self.build()
+            self.save()
+        self.min_step_scale = self._min_step_scale()
+
+    @property
+    def artifact_group(self) -> str:
+        return f"hpa_c{self.cluster_size}_e{self.entrance_spacing}"
+
+    def _reset(self):
+        nav = self.navigator
+        self.free = nav.inflated_map == 0
+        height, width = self.free.shape
+        cs = self.cluster_size
+        self.clusters_x = (width + cs - 1) // cs
+        self.clusters_y = (height + cs - 1) // cs
+
+        self.nodes: List[Tuple[int, int]] = []
+        self.node_at: Dict[Tuple[int, int], int] = {}
+        self.cluster_nodes: List[List[int]] = [[] for _ in range(self.clusters_x * self.clusters_y)]
+        self.adjacency: List[List[Tuple[int, float]]] = []
+        self.links: List[Tuple[int, int, float]] = []
+        self.edge_paths: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def build(self):
+        """Rebuild the cluster graph from ``inflated_map``."""
+        started = time.time()
+        self._reset()
+
+        self._find_entrances()
+        for cluster in range(len(self.cluster_nodes)):
+            self._connect_cluster(cluster)
+
+        self.build_time = time.time() - started
+        print(f"Hierarchical planner built: {len(self.nodes)} nodes, "
+              f"{len(self.edge_paths)} intra-cluster edges in {self.build_time:.2f}s")
+
+    def update(self, previous: 'HierarchicalPlanner', dirty: Tuple[int, int, int, int]):
+        """Rebuild from ``previous`` after the cells in ``dirty`` (x0, y0, x1, y1) changed.
+
+        Entrances are found again over the whole map (a cheap scan); only
+        clusters that overlap ``dirty`` or whose entrance set changed run
+        their window searches again.
+        """
+        started = time.time()
+        self._reset()
+        self._find_entrances()
+
+        x0, y0, x1, y1 = dirty
+        cs = self.cluster_size
+        dirty_clusters = {cy * self.clusters_x + cx
+                          for cy in range(y0 // cs, (y1 - 1) // cs + 1)
+                          for cx in range(x0 // cs, (x1 - 1) // cs + 1)}
+
+        kept_edges: Dict[int, List] = {}
+        for a, b, cost in previous.links:
+            cluster = previous.cluster_of(*previous.nodes[a])
+            if cluster in dirty_clusters or (a, b) not in previous.edge_paths:
+                continue
+            kept_edges.setdefault(cluster, []).append(
+                (previous.nodes[a], previous.nodes[b], cost, previous.edge_paths[(a, b)]))
+
+        reconnected = 0
+        for cluster, members in enumerate(self.cluster_nodes):
+            old_cells = {previous.nodes[n] for n in previous.cluster_nodes[cluster]}
+            if cluster in dirty_clusters or {self.nodes[n] for n in members} != old_cells:
+                self._connect_cluster(cluster)
+                reconnected += 1
+                continue
+            for cell_a, cell_b, cost, path in kept_edges.get(cluster, ()):
+                a, b = self.node_at[cell_a], self.node_at[cell_b]
+                self._link(a, b, cost)
+                self.edge_paths[(a, b)] = path
+
+        self.build_time = time.time() - started
+        print(f"Hierarchical planner updated: {reconnected} of {len(self.cluster_nodes)} "
+              f"clusters reconnected in {self.build_time:.2f}s")
+
+    def save(self) -> bool:
+        if self.artifacts is None:
+            return False
+        keys = list(self.edge_paths)
+        paths = [self.edge_paths[key] for key in keys]
+        offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(path) for path in paths])
+        return self.artifacts.save(
+            self.artifact_group,
+            nodes=np.asarray(self.nodes, dtype=np.int32).reshape(-1, 2),
+            links=np.asarray([(a, b) for a, b, _ in self.links], dtype=np.int32).reshape(-1, 2),
+            link_costs=np.asarray([cost for _, _, cost in self.links], dtype=np.float64),
+            edge_keys=np.asarray(keys, dtype=np.int32).reshape(-1, 2),
+            edge_offsets=offsets,
+            edge_points=(np.concatenate(paths) if paths else np.zeros((0, 2))).astype(np.int32))
+
+    def load(self) -> bool:
+        """Restore a saved graph; links are replayed in build order, so
+        neighbour order and therefore every query result is unchanged."""
+        if self.artifacts is None:
+            return False
+        saved = self.artifacts.load(self.artifact_group, mmap_mode=None)
+        if saved is None:
+            return False
+        started = time.time()
+        self._reset()
+        for x, y in saved['nodes'].tolist():
+            self._add_node(x, y)
+        for (a, b), cost in zip(saved['links'].tolist(), saved['link_costs'].tolist()):
+            self._link(a, b, cost)
+        offsets = saved['edge_offsets']
+        points = saved['edge_points']
+        for i, (a, b) in enumerate(saved['edge_keys'].tolist()):
+            self.edge_paths[(a, b)] = points[offsets[i]:offsets[i + 1]]
+
+        self.build_time = time.time() - started
+        print(f"Hierarchical planner loaded: {len(self.nodes)} nodes, "
+              f"{len(self.edge_paths)} intra-cluster edges in {self.build_time:.2f}s")
+        return True
+
+    def cluster_of(self, x: int, y: int) -> int:
+        return (y // self.cluster_size) * self.clusters_x + (x // self.cluster_size)
+
+    def cluster_bounds(self, cluster: int) -> Tuple[int, int, int, int]:
+        cs = self.cluster_size
+        height, width = self.free.shape
+        cy, cx = divmod(cluster, self.clusters_x)
+        return (cx * cs, cy * cs, min(width, (cx + 1) * cs), min(height, (cy + 1) * cs))
+
+    def _add_node(self, x: int, y: int) -> int:
+        cell = (x, y)
+        node = self.node_at.get(cell)
+        if node is None:
+            node = len(self.nodes)
+            self.nodes.append(cell)
+            self.node_at[cell] = node
+            self.adjacency.append([])
+            self.cluster_nodes[self.cluster_of(x, y)].append(node)
+        return node
+
+    def _entrance_positions(self, run_start: int, run_end: int) -> List[int]:
+        # Centre the entrances of a run so abstract paths keep off the walls
+        length = run_end - run_start
+        count = -(-length // self.entrance_spacing)
+        return [run_start + (2 * i + 1) * length // (2 * count) for i in range(count)]
+
+    def _border_runs(self, both_free: np.ndarray, span: int):
+        """Yield (start, end) runs of free cells within each cluster-sized span."""
+        for offset in range(0, len(both_free), span):
+            segment = both_free[offset:offset + span].astype(np.int8)
+            edges = np.diff(np.concatenate(([0], segment, [0])))
+            for run_start, run_end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                yield offset + int(run_start), offset + int(run_end)
+
+    def _find_entrances(self):
+        cs = self.cluster_size
+        height, width = self.free.shape
+        straight = self.navigator.straight_cost
+        costmap = self.navigator.costmap
+        half = self.half_scale
+
+        for x in range(cs, width, cs):
+            both_free = self.free[:, x - 1] & self.free[:, x]
+            for run_start, run_end in self._border_runs(both_free, cs):
+                for y in self._entrance_positions(run_start, run_end):
+                    cost = straight * (half[costmap[y, x - 1]] + half[costmap[y, x]])
+                    self._link(self._add_node(x - 1, y), self._add_node(x, y), cost)
+
+        for y in range(cs, height, cs):
+            both_free = self.free[y - 1, :] & self.free[y, :]
+            for run_start, run_end in self._border_runs(both_free, cs):
+                for x in self._entrance_positions(run_start, run_end):
+                    cost = straight * (half[costmap[y - 1, x]] + half[costmap[y, x]])
+                    self._link(self._add_node(x, y - 1), self._add_node(x, y), cost)
+
+    def _link(self, a: int, b: int, cost: float):
+        self.links.append((a, b, cost))
+        self.adjacency[a].append((b, cost))
+        self.adjacency[b].append((a, cost))
+
+    def _connect_cluster(self, cluster: int):
+        members = self.cluster_nodes[cluster]
+        if len(members) < 2:
+            return
+        window = self._window(cluster)
+        for i, a in enumerate(members):
+            targets = {self.nodes[b]: b for b in members[i + 1:]}
+            found = self._window_search(window, self.nodes[a], targets)
+            for b, (cost, path) in found.items():
+                self._link(a, b, cost)
+                self.edge_paths[(a, b)] = np.asarray(path, dtype=np.int32)
+
+    def _window(self, cluster: int):
+        x0, y0, x1, y1 = self.cluster_bounds(cluster)
+        stride = (y1 - y0) + 2
+        padded = np.ones((x1 - x0 + 2, stride), dtype=np.uint8)
+        padded[1:-1, 1:-1] = ~self.free[y0:y1, x0:x1].T
+        clearance = np.full(padded.shape, 254, dtype=np.uint8)
+        clearance[1:-1, 1:-1] = self.navigator.costmap[y0:y1, x0:x1].T
+        return (x0, y0, stride, padded.tobytes(), clearance.tobytes())
+
+    def _window_search(self, window, source: Tuple[int, int],
+                       targets: Dict[Tuple[int, int], int]) -> Dict[int, Tuple[float, List[Tuple[int, int]]]]:
+        """Dijkstra from ``source`` inside one cluster window.
+
+        Stops once every target cell is settled and returns
+        ``{target_id: (cost, path)}`` for the reachable ones.
+        """
+        x0, y0, stride, blocked, clearance = window
+        half = self.half_scale
+        nav = self.navigator
+        moves = [(stride, nav.straight_cost), (1, nav.straight_cost),
+                 (-stride, nav.straight_cost), (-1, nav.straight_cost)]
+        if nav.allow_diagonal:
+            moves.extend([(stride + 1, nav.diagonal_cost), (stride - 1, nav.diagonal_cost),
+                          (-stride + 1, nav.diagonal_cost), (-stride - 1, nav.diagonal_cost)])
+
+        def index(cell):
+            return (cell[0] - x0 + 1) * stride + (cell[1] - y0 + 1)
+
+        def cell(i):
+            px, py = divmod(i, stride)
+            return (px - 1 + x0, py - 1 + y0)
+
+        pending = {index(c): t for c, t in targets.items()}
+        size = len(blocked)
+        g = [float('inf')] * size
+        parent = [-1] * size
+        closed = bytearray(size)
+        source_i = index(source)
+        g[source_i] = 0.0
+        open_set = [(0.0, source_i)]
+        found = {}
+
+        while open_set and pending:
+            cost, current = heapq.heappop(open_set)
+            if closed[current]:
+                continue
+            closed[current] = 1
+            target = pending.pop(current, None)
+            if target is not None:
+                path = []
+                i = current
+                while i != -1:
+                    path.append(cell(i))
+                    i = parent[i]
+                found[target] = (cost, path[::-1])
+            here = half[clearance[current]]
+            for offset, step in moves:
+                neighbor = current + offset
+                if blocked[neighbor] or closed[neighbor]:
+                    continue
+                tentative_g = cost + step * (here + half[clearance[neighbor]])
+                if tentative_g < g[neighbor]:
+                    g[neighbor] = tentative_g
+                    parent[neighbor] = current
+                    heapq.heappush(open_set, (tentative_g, neighbor))
+
+        return found
+
+    def _min_step_scale(self) -> float:
+        """Smallest factor clearance costs put on a step between free cells."""
+        clearance = self.navigator.costmap[self.free]
+        if not clearance.size:
+            return 1.0
+        return 2 * self.half_scale[int(clearance.min())]
+
+    def _octile(self, a: Tuple[int, int], b: Tuple[int, int]) -> float:
+        return self.navigator.heuristic(a[0], a[1], b[0], b[1])
+
+    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int],
+                  stats: Optional[dict] = None) -> Optional[List[Tuple[int, int]]]:
+        start = (int(start[0]), int(start[1]))
+        goal = (int(goal[0]), int(goal[1]))
+        if start == goal:
+            return [start]
+
+        start_cluster = self.cluster_of(*start)
+        goal_cluster = self.cluster_of(*goal)
+
+        start_targets = {self.nodes[n]: n for n in self.cluster_nodes[start_cluster]}
+        if start_cluster == goal_cluster:
+            start_targets[goal] = GOAL_NODE
+        start_links = self._window_search(self._window(start_cluster), start, start_targets)
+        goal_links = self._window_search(
+            self._window(goal_cluster), goal,
+            {self.nodes[n]: n for n in self.cluster_nodes[goal_cluster]})
+
+        best = start_links.pop(GOAL_NODE, None)
+        abstract = self._abstract_search(start, goal, start_links, goal_links,
+                                         best[0] if best else float('inf'))
+        if abstract is not None:
+            cost, nodes = abstract
+            best = (cost, self._refine(nodes, start_links, goal_links))
+
+        # Entrances only sit on straight runs free on both sides of a border,
+        # so clusters joined only diagonally or at a corner have no abstract
+        # edge; weighted A* settles whether the goal is really unreachable,
+        # unless only one end lies in the largest free region
+        nav = self.navigator
+        if best is None and nav.is_navigable(*start) != nav.is_navigable(*goal):
+            if stats is not None:
+                stats['fallback'] = False
+            return None
+        lower_bound = self.min_step_scale * self._octile(start, goal)
+        fallback = best is None or best[0] > self.suboptimality * lower_bound
+        if stats is not None:
+            stats['fallback'] = fallback
+        if fallback:
+            return self.navigator.grid_astar.find_path(start, goal, weight=self.suboptimality, stats=stats)
+        return best[1]
+
+    def _abstract_search(self, start, goal, start_links, goal_links, bound: float):
+        """A* over entrance nodes; returns (cost, node sequence) or None."""
+        goal_costs = {node: cost for node, (cost, _) in goal_links.items()}
+        nodes = self.nodes
+        g = {START_NODE: 0.0}
+        came_from = {}
+        closed = set()
+        open_set = [(self._octile(start, goal), START_NODE)]
+
+        while open_set:
+            f, current = heapq.heappop(open_set)
+            if f >= bound:
+                return None
+            if current in closed:
+                continue
+            closed.add(current)
+            if current == GOAL_NODE:
+                sequence = []
+                while current in came_from:
+                    sequence.append(current)
+                    current = came_from[current]
+                return g[GOAL_NODE], sequence[::-1]
+
+            if current == START_NODE:
+                edges = [(node, cost) for node, (cost, _) in start_links.items()]
+            else:
+                edges = self.adjacency[current]
+                if current in goal_costs:
+                    edges = edges + [(GOAL_NODE, goal_costs[current])]
+
+            g_current = g[current]
+            for neighbor, cost in edges:
+                if neighbor in closed:
+                    continue
+                tentative_g = g_current + cost
+                if tentative_g < g.get(neighbor, float('inf')):
+                    g[neighbor] = tentative_g
+                    came_from[neighbor] = current
+                    h = 0.0 if neighbor == GOAL_NODE else self._octile(nodes[neighbor], goal)
+                    heapq.heappush(open_set, (tentative_g + h, neighbor))
+
+        return None
+
+    def _refine(self, sequence: List[int], start_links, goal_links) -> List[Tuple[int, int]]:
+        path = list(start_links[sequence[0]][1])
+        for a, b in zip(sequence, sequence[1:]):
+            if b == GOAL_NODE:
+                path.extend(goal_links[a][1][::-1][1:])
+            elif (a, b) in self.edge_paths:
+                path.extend(map(tuple, self.edge_paths[(a, b)][1:].tolist()))
+            elif (b, a) in self.edge_paths:
+                path.extend(map(tuple, self.edge_paths[(b, a)][::-1][1:].tolist()))
+            else:
+                path.append(self.nodes[b])
+        return path
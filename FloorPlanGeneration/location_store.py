@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import fcntl
+import json
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def validate_location(name, location) -> Dict:
+    """The location as stored, or ValueError if it lacks a name or numeric x/y."""
+    if not isinstance(name, str) or not name:
+        raise ValueError('Location names must be non-empty strings')
+    if not isinstance(location, dict):
+        raise ValueError(f'Location {name} must be an object')
+    try:
+        x, y = float(location['x']), float(location['y'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f'Location {name} needs numeric x and y')
+    if not (math.isfinite(x) and math.isfinite(y)):
+        raise ValueError(f'Location {name} needs finite x and y')
+    if all(type(location[key]) in (int, float) for key in ('x', 'y')):
+        return location
+    return dict(location, x=x, y=y)
+
+
+class GridIndex:
+    """Named points bucketed in square cells for nearest-neighbour queries.
+
+    A query scans rings of cells outward, starting with the first ring that
+    reaches the occupied cells, and stops once the ring is farther away than
+    the k-th best point found, so it touches a handful of cells however many
+    locations there are. When more rings could need scanning than there are
+    points (sparse points far apart) it compares every point instead.
+    """
+
+    def __init__(self, cell_size: float = 1.0):
+        self.cell_size = float(cell_size)
+        self._cells: Dict[Tuple[int, int], Dict[str, Tuple[float, float]]] = {}
+        self._points: Dict[str, Tuple[float, float]] = {}
+        # Cell range that has held points; removals do not shrink it
+        self._bounds: Optional[List[int]] = None
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def add(self, name: str, x: float, y: float):
+        self.remove(name)
+        self._points[name] = (x, y)
+        cell = self._cell(x, y)
+        self._cells.setdefault(cell, {})[name] = (x, y)
+        if self._bounds is None:
+            self._bounds = [cell[0], cell[0], cell[1], cell[1]]
+        else:
+            self._bounds = [min(self._bounds[0], cell[0]), max(self._bounds[1], cell[0]),
+                            min(self._bounds[2], cell[1]), max(self._bounds[3], cell[1])]
+
+    def remove(self, name: str):
+        point = self._points.pop(name, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        del self._cells[cell][name]
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def nearest(self, x: float, y: float, k: int = 1,
+                max_distance: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Up to ``k`` ``(name, distance)`` pairs, closest first."""
+        if not self._points or k < 1:
+            return []
+        limit = math.inf if max_distance is None else max_distance
+        cx, cy = self._cell(x, y)
+        # Nearest and farthest rings that can hold any point at all
+        min_x, max_x, min_y, max_y = self._bounds
+        first = max(0, min_x - cx, cx - max_x, min_y - cy, cy - max_y)
+        last = max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+        if last - first >= len(self._points):
+            found = sorted((math.hypot(px - x, py - y), name) for name, (px, py) in self._points.items())
+            return [(name, distance) for distance, name in found[:k] if distance <= limit]
+        found: List[Tuple[float, str]] = []
+        for ring in range(first, last + 1):
+            # Points in this ring are at least (ring - 1) cells away
+            bound = (ring - 1) * self.cell_size
+            if bound > limit or (len(found) >= k and bound > found[k - 1][0]):
+                break
+            for cell in self._ring(cx, cy, ring, self._bounds):
+                for name, (px, py) in self._cells.get(cell, {}).items():
+                    distance = math.hypot(px - x, py - y)
+                    if distance <= limit:
+                        found.append((distance, name))
+            found.sort()
+        return [(name, distance) for distance, name in found[:k]]
+
+    @staticmethod
+    def _ring(cx: int, cy: int, ring: int, bounds: List[int]) -> Iterable[Tuple[int, int]]:
+        """Cells of the square ring around (cx, cy) that lie inside bounds."""
+        min_x, max_x, min_y, max_y = bounds
+        if ring == 0:
+            yield (cx, cy)
+            return
+        xs = range(max(cx - ring, min_x), min(cx + ring, max_x) + 1)
+        for y in (cy - ring, cy + ring):
+            if min_y <= y <= max_y:
+                for x in xs:
+                    yield (x, y)
+        ys = range(max(cy - ring + 1, min_y), min(cy + ring - 1, max_y) + 1)
+        for x in (cx - ring, cx + ring):
+            if min_x <= x <= max_x:
+                for y in ys:
+                    yield (x, y)
+
+
+class LocationStore:
+    """Named locations in memory, persisted as a JSON snapshot plus a change log.
+
+    Writes append one JSON line per transaction to ``<path>.log`` under an
+    exclusive ``flock``, so upserts and deletes cost a line instead of
+    rewriting the file, and server processes sharing the files cannot
+    interleave. After ``compact_every`` log lines (or a full replace) the
+    snapshot is rewritten through a temporary file and ``os.replace`` and
+    the log is emptied. Replaying a log over a snapshot that already holds
+    it is harmless, so a crash between the two steps loses nothing; a torn
+    last line is ignored and cut off by the next write.
+
+    ``sync`` picks up what other processes wrote by reading only the log
+    lines past its offset, under a shared ``flock`` so it never sees a
+    compaction halfway (the new snapshot with the old log). ``etag`` is derived from the files' state, so
+    every process in sync with them reports the same tag.
+    """
+
+    def __init__(self, path: str, compact_every: int = 100, index_cell: float = 1.0):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.compact_every = max(1, int(compact_every))
+        self.index_cell = float(index_cell)
+        self._lock = threading.RLock()
+        self._locations: Dict[str, Dict] = {}
+        self._index = GridIndex(self.index_cell)
+        self._snapshot_id = None
+        self._offset = 0
+        self._log_lines = 0
+        self.version = 0
+        self.sync()
+
+    @staticmethod
+    def _file_id(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _log_size(self) -> int:
+        try:
+            return os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+
+    def _apply(self, op: Dict):
+        if op['op'] == 'put':
+            self._locations[op['name']] = op['location']
+            self._index.add(op['name'], op['location']['x'], op['location']['y'])
+        elif op['op'] == 'delete':
+            self._locations.pop(op['name'], None)
+            self._index.remove(op['name'])
+
+    def _set_all(self, locations: Dict[str, Dict]):
+        self._locations = dict(locations)
+        self._index = GridIndex(self.index_cell)
+        for name, location in self._locations.items():
+            self._index.add(name, location['x'], location['y'])
+
+    def _reload(self):
+        snapshot_id = self._file_id(self.path)
+        locations = {}
+        if snapshot_id is not None:
+            with open(self.path, 'r') as f:
+                locations = {name: validate_location(name, location) for name, location in json.load(f).items()}
+        self._set_all(locations)
+        self._snapshot_id = snapshot_id
+        self._offset = 0
+        self._log_lines = 0
+        self._read_log()
+
+    def _read_log(self):
+        """Apply complete log lines past the offset; a partial last line waits."""
+        if self._log_size() <= self._offset:
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn record from a crashed writer, cut off by the next write
+                continue
+            for op in record['ops']:
+                self._apply(op)
+            self._log_lines += 1
+        self._offset += end
+
+    def sync(self) -> bool:
+        """Catch up with changes written by other processes; True if any."""
+        with self._lock:
+            try:
+                log = open(self.log_path, 'rb')
+            except FileNotFoundError:
+                # Nothing was ever written, so no compaction can be under way
+                return self._sync()
+            with log:
+                fcntl.flock(log, fcntl.LOCK_SH)
+                try:
+                    return self._sync()
+                finally:
+                    fcntl.flock(log, fcntl.LOCK_UN)
+
+    def _sync(self) -> bool:
+        """``sync`` for a caller that already holds the log lock."""
+        with self._lock:
+            before = (self._snapshot_id, self._offset)
+            if self._file_id(self.path) != self._snapshot_id or self._log_size() < self._offset:
+                self._reload()
+            else:
+                self._read_log()
+            changed = (self._snapshot_id, self._offset) != before
+            if changed:
+                self.version += 1
+            return changed
+
+    @property
+    def etag(self) -> str:
+        snapshot = self._snapshot_id or (0, 0, 0)
+        return f'{snapshot[0]:x}-{snapshot[1]:x}-{self._offset:x}'
+
+    def all(self) -> Dict[str, Dict]:
+        with self._lock:
+            return dict(self._locations)
+
+    def get(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            return self._locations.get(name)
+
+    def state(self) -> Tuple[Dict[str, Dict], str]:
+        """``(locations, etag)`` as of one consistent moment."""
+        with self._lock:
+            self.sync()
+            return dict(self._locations), self.etag
+
+    def nearest(self, x: float, y: float, k: int = 1,
+                max_distance: Optional[float] = None) -> List[Tuple[str, float]]:
+        with self._lock:
+            return self._index.nearest(x, y, k, max_distance)
+
+    def transaction(self, upserts: Optional[Dict[str, Dict]] = None, deletes: Iterable[str] = (),
+                    replace: Optional[Dict[str, Dict]] = None, if_match: Optional[str] = None) -> str:
+        """Apply upserts and deletes (or a full replace) atomically; return the new etag.
+
+        Raises ValueError for a malformed location, KeyError for deleting an
+        unknown name and ``LocationConflict`` when ``if_match`` is not the
+        current etag. Nothing is applied if any check fails.
+        """
+        if replace is not None:
+            replace = {name: validate_location(name, location) for name, location in replace.items()}
+        ops = [{'op': 'put', 'name': name, 'location': validate_location(name, location)}
+               for name, location in (upserts or {}).items()]
+        ops += [{'op': 'delete', 'name': name} for name in deletes]
+        with self._lock, open(self.log_path, 'ab') as log:
+            fcntl.flock(log, fcntl.LOCK_EX)
+            try:
+                self._sync()
+                if if_match is not None and if_match.strip().strip('"') not in (self.etag, '*'):
+                    raise LocationConflict(self.etag)
+                missing = [op['name'] for op in ops if op['op'] == 'delete' and op['name'] not in self._locations]
+                if missing:
+                    raise KeyError(missing[0])
+                if replace is not None:
+                    self._set_all(replace)
+                for op in ops:
+                    self._apply(op)
+                if replace is not None or self._log_lines + 1 >= self.compact_every:
+                    self._compact(log)
+                else:
+                    self._append(log, ops)
+                self.version += 1
+                return self.etag
+            finally:
+                fcntl.flock(log, fcntl.LOCK_UN)
+
+    def _append(self, log, ops: List[Dict]):
+        # Drop a torn tail so the new record starts on its own line
+        if self._log_size() > self._offset:
+            log.truncate(self._offset)
+        log.write((json.dumps({'ops': ops}) + '\n').encode())
+        log.flush()
+        os.fsync(log.fileno())
+        self._offset = log.tell()
+        self._log_lines += 1
+
+    def _compact(self, log):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self._locations, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        log.truncate(0)
+        self._snapshot_id = self._file_id(self.path)
+        self._offset = 0
+        self._log_lines = 0
+        print(f"Compacted {len(self._locations)} locations into {self.path}")
+
+
+class LocationConflict(Exception):
+    """A conditional write whose If-Match etag is no longer current."""
+
+    def __init__(self, etag: str):
+        super().__init__(f'Locations changed; current etag is {etag}')
+        self.etag = etag
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+from typing import Dict, Optional
+
+
+class ArtifactStore:
+    """On-disk cache of arrays derived from one floor plan.
+
+    Artifacts live in ``<root>/<signature>/`` as plain ``.npy`` files, so a
+    restart memory-maps them instead of decoding, thresholding and dilating
+    the image again. The directory is keyed by the navigator's
+    ``map_signature``; a new image or config simply misses the cache.
+    Each named group is written array by array and marked complete last,
+    so a crash mid-write is treated as a miss rather than loaded.
+    """
+
+    def __init__(self, root: str, signature: str):
+        self.directory = os.path.join(root, signature[:16])
+
+    def _path(self, group: str, key: str) -> str:
+        return os.path.join(self.directory, f"{group}.{key}.npy")
+
+    def _marker(self, group: str) -> str:
+        return os.path.join(self.directory, f"{group}.complete")
+
+    def load(self, group: str, mmap_mode: Optional[str] = 'r') -> Optional[Dict[str, np.ndarray]]:
+        """Return the group's arrays (memory-mapped by default), or None on a miss."""
+        marker = self._marker(group)
+        if not os.path.exists(marker):
+            return None
+        try:
+            with open(marker, 'r') as f:
+                keys = f.read().split()
+            return {key: np.load(self._path(group, key), mmap_mode=mmap_mode) for key in keys}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable artifact {group}: {e}")
+            return None
+
+    def save(self, group: str, **arrays: np.ndarray) -> bool:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for key, array in arrays.items():
+                path = self._path(group, key)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(array))
+                os.replace(tmp, path)
+            tmp = f"{self._marker(group)}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                f.write('\n'.join(arrays))
+            os.replace(tmp, self._marker(group))
+            return True
+        except OSError as e:
+            print(f"Could not save artifact {group}: {e}")
+            return False
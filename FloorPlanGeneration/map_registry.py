@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import heapq
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class MapRegistry:
+    """Maps loaded on first use and evicted least recently used under a memory budget.
+
+    ``maps`` gives each map id the spec ``load(map_id, spec)`` needs to
+    build it. A loaded map is any object with a ``navigator`` attribute and
+    ``memory_bytes()`` and ``close()`` methods. Loads run outside the
+    registry lock (one lock per map), so a floor that takes seconds to load
+    does not hold up requests to floors already in memory. After each load
+    the least recently used maps are closed and dropped until the loaded
+    maps fit ``memory_budget`` bytes; pinned maps are never evicted, and
+    neither are maps a request holds (see ``holding``) until it finishes.
+
+    Connectors join floors: each has an id, a ``cost`` in meters for using
+    it (stairs are slower than a lift) and a point in meters on every map
+    it reaches. ``plan`` picks the cheapest chain of connectors between two
+    maps with Dijkstra over the connector points, pricing each walk on a
+    floor from the goal's or connector's cached distance field.
+    """
+
+    def __init__(self, maps: Dict[str, Dict], load: Callable, memory_budget: int,
+                 connectors: Iterable[Dict] = (), pinned: Iterable[str] = ()):
+        self.maps = dict(maps)
+        self.load = load
+        self.memory_budget = int(memory_budget)
+        self.pinned = set(pinned)
+        self.connectors = {str(c['id']): {'cost': float(c.get('cost', 0.0)), 'points': dict(c['points'])}
+                           for c in connectors}
+        unknown = {m for c in self.connectors.values() for m in c['points']} - set(self.maps)
+        if unknown:
+            raise ValueError(f"Connectors reference unknown maps: {', '.join(sorted(unknown))}")
+        self._loaded: OrderedDict = OrderedDict()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # One set of map ids per request that holds maps
+        self._holds: List[set] = []
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def add(self, map_id: str, loaded):
+        """Register a map that was built elsewhere (e.g. the default map at startup)."""
+        with self._lock:
+            self._loaded[map_id] = loaded
+
+    def hold(self) -> set:
+        """Start holding maps: ids added to the returned set are not evicted until ``release``."""
+        held = set()
+        with self._lock:
+            self._holds.append(held)
+        return held
+
+    def release(self, held: set):
+        with self._lock:
+            self._holds = [other for other in self._holds if other is not held]
+        self.trim()
+
+    @contextmanager
+    def holding(self):
+        held = self.hold()
+        try:
+            yield held
+        finally:
+            self.release(held)
+
+    def get(self, map_id: str, held: Optional[set] = None):
+        """The loaded map, loading it first if needed; KeyError for an unknown id.
+
+        With ``held`` (from ``hold``) the map stays loaded until it is released.
+        """
+        with self._lock:
+            if map_id not in self.maps:
+                raise KeyError(map_id)
+            if held is not None:
+                held.add(map_id)
+            loaded = self._loaded.get(map_id)
+            if loaded is not None:
+                self._loaded.move_to_end(map_id)
+                return loaded
+            load_lock = self._load_locks.setdefault(map_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                loaded = self._loaded.get(map_id)
+            if loaded is None:
+                loaded = self.load(map_id, self.maps[map_id])
+                with self._lock:
+                    self._loaded[map_id] = loaded
+                    self.loads += 1
+                self.trim(keep=map_id)
+            return loaded
+
+    def trim(self, keep: Optional[str] = None) -> List[str]:
+        """Evict least recently used maps until the rest fit the budget."""
+        evicted = []
+        with self._lock:
+            sizes = {map_id: loaded.memory_bytes() for map_id, loaded in self._loaded.items()}
+            total = sum(sizes.values())
+            held = set().union(*self._holds)
+            for map_id in list(self._loaded):
+                if total <= self.memory_budget:
+                    break
+                if map_id in self.pinned or map_id in held or map_id == keep:
+                    continue
+                evicted.append((map_id, self._loaded.pop(map_id)))
+                total -= sizes[map_id]
+                self.evictions += 1
+        for map_id, loaded in evicted:
+            loaded.close()
+            print(f"Evicted map {map_id} ({sizes[map_id] / (1024 * 1024):.1f}MB)")
+        return [map_id for map_id, _ in evicted]
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            loaded = dict(self._loaded)
+        return [{
+            'id': map_id,
+            'loaded': map_id in loaded,
+            'pinned': map_id in self.pinned,
+            'memory_mb': round(loaded[map_id].memory_bytes() / (1024 * 1024), 1) if map_id in loaded else None,
+        } for map_id in self.maps]
+
+    def _cell(self, navigator, point: Dict) -> Optional[Tuple[int, int]]:
+        """A connector point in pixels, moved onto a navigable cell if needed."""
+        cell = navigator.meters_to_pixels(point['x'], point['y'])
+        if navigator.is_navigable(*cell):
+            return cell
+        return navigator.snap(*cell)
+
+    def plan(self, start_map: str, start: Tuple[int, int], goal_map: str,
+             goal: Tuple[int, int], held: Optional[set] = None) -> Optional[Tuple[float, List[Dict]]]:
+        """Cheapest route between maps as ``(cost, legs)``, None if no connectors join them.
+
+        Each leg is ``{'map', 'start', 'goal', 'connector'}`` with pixel
+        cells on that map; ``connector`` is the one taken at the leg's end
+        (None for the last leg). Costs are in meters, including clearance
+        penalties when the maps use them. Every map the search loads is
+        added to ``held``, so the legs can be routed without reloading.
+        """
+        # Connector cells per map, worked out when the search first reaches the map
+        cells: Dict[str, Dict[str, Tuple[int, int]]] = {}
+
+        def cells_on(map_id: str) -> Dict[str, Tuple[int, int]]:
+            if map_id not in cells:
+                navigator = self.get(map_id, held).navigator
+                cells[map_id] = {}
+                for connector_id, connector in self.connectors.items():
+                    if map_id in connector['points']:
+                        cell = self._cell(navigator, connector['points'][map_id])
+                        if cell is not None:
+                            cells[map_id][connector_id] = cell
+            return cells[map_id]
+
+        def walk_costs(map_id: str, origin: Tuple[int, int]) -> Callable[[Tuple[int, int]], float]:
+            """Meters from origin to any cell of the map, from origin's distance field."""
+            navigator = self.get(map_id, held).navigator
+            # Grid distances are symmetric, so the origin's field prices walks both ways
+            field = navigator.flow_fields.field(origin)
+            to_index = navigator.grid_astar.to_index
+            return lambda cell: float(field[to_index(int(cell[0]), int(cell[1]))]) * navigator.resolution
+
+        to_goal = walk_costs(goal_map, goal)
+        best = {('start', start_map): 0.0}
+        previous = {}
+        queue = [(0.0, 'start', start_map)]
+        while queue:
+            cost, node, map_id = heapq.heappop(queue)
+            if cost > best.get((node, map_id), np.inf):
+                continue
+            if node == 'goal':
+                break
+            if node == 'start':
+                origin = start
+            elif node in cells_on(map_id):
+                origin = cells_on(map_id)[node]
+            else:
+                # The connector has no navigable point on this map
+                continue
+            from_origin = walk_costs(map_id, origin)
+            edges = [(connector_id, map_id, from_origin(cell))
+                     for connector_id, cell in cells_on(map_id).items() if connector_id != node]
+            if node != 'start':
+                if map_id == goal_map:
+                    edges.append(('goal', goal_map, to_goal(origin)))
+                connector = self.connectors[node]
+                edges += [(node, other_map, connector['cost'])
+                          for other_map in connector['points'] if other_map != map_id]
+            for next_node, next_map, step in edges:
+                total = cost + step
+                if np.isfinite(step) and total < best.get((next_node, next_map), np.inf):
+                    best[(next_node, next_map)] = total
+                    previous[(next_node, next_map)] = (node, map_id)
+                    heapq.heappush(queue, (total, next_node, next_map))
+
+        if ('goal', goal_map) not in best:
+            return None
+        chain = [('goal', goal_map)]
+        while chain[-1] != ('start', start_map):
+            chain.append(previous[chain[-1]])
+        chain.reverse()
+
+        legs = []
+        leg_start = start
+        for (node, map_id), (next_node, next_map) in zip(chain, chain[1:]):
+            if next_map != map_id:
+                # Taking the connector to another floor; the next leg starts there
+                leg_start = cells[next_map][next_node]
+                continue
+            end = goal if next_node == 'goal' else cells[map_id][next_node]
+            legs.append({'map': map_id, 'start': leg_start, 'goal': end,
+                         'connector': None if next_node == 'goal' else next_node})
+            leg_start = end
+        return best[('goal', goal_map)], legs
@@ -1,27 +1,396 @@
 #!/usr/bin/env python3
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, has_request_context, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS, cross_origin
+from contextlib import contextmanager
+import gc
 import json
+import logging
+import math
 import os
+import signal
+import socket
+import sys
+import threading
+import time
 import traceback
-from astar_navigation import FloorPlanNavigator
+import numpy as np
+from werkzeug.local import LocalProxy
+from astar_navigation import FloorPlanNavigator, PLANNERS
+from route_table import RouteTable, UNREACHABLE
+from dstar_lite import NavigationSessions
+from route_cache import RouteCache
+from shared_map import SharedArrays
+from batch_routing import BatchRouter, route_result
+from server_metrics import Metrics
+from anchor_registry import AnchorRegistry
+from trilateration import DeviceFilters, MIN_RANGES, trilaterate
+from location_store import LocationConflict, LocationStore
+import path_encoding
+from map_registry import MapRegistry
 
 app = Flask(__name__)
 # Configure CORS with explicit settings
-CORS(app, resources={r"/api/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"]}})
+CORS(app, resources={r"/api/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+                                 "expose_headers": ["ETag", "X-Anchor-Version", "X-Route-Planner", "X-Route-Snapped"]}})
 
 # Configuration
 CONFIG_FILE = 'floor_plan_updated_config.yaml'
 LOCATIONS_FILE = 'office_locations_updated.json'
 
-# Initialize navigator
-try:
-    navigator = FloorPlanNavigator(CONFIG_FILE)
-    print(f"Navigator initialized successfully")
-except Exception as e:
-    print(f"Error initializing navigator: {e}")
-    navigator = None
+# Initialize the configured map's navigator; its config also holds the server settings
+default_navigator = None
+# Batch pool processes re-import this script as __mp_main__ and load their
+# own navigator, so they skip the server's (and everything built on it)
+if __name__ != '__mp_main__':
+    try:
+        default_navigator = FloorPlanNavigator(CONFIG_FILE)
+        print(f"Navigator initialized successfully")
+    except Exception as e:
+        print(f"Error initializing navigator: {e}")
+        default_navigator = None
+
+# Worker processes when run as a script; the pre-fork parent must not start
+# threads before forking, so it fills the route table in its own thread and
+# the children only read it
+SERVER_WORKERS = int(os.environ.get('MAP_SERVER_WORKERS', default_navigator.config.get('server_workers', 1) if default_navigator else 1))
+PREFORK = __name__ == '__main__' and SERVER_WORKERS > 1
+
+# Request latency per route and phase, planner counters; scraped from /api/metrics
+metrics = Metrics()
+# One JSON line per request with its phase timings, when request_log is on
+REQUEST_LOG = bool(default_navigator.config.get('request_log', False)) if default_navigator else False
+request_log = logging.getLogger('map_server.requests')
+if REQUEST_LOG:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    request_log.addHandler(handler)
+    request_log.setLevel(logging.INFO)
+    request_log.propagate = False
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the current request's phase timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.phases[name] = g.phases.get(name, 0.0) + time.perf_counter() - started
+
+class ServedMap:
+    """A map's navigator with the serving state built on it"""
+    
+    def __init__(self, map_id, config_file, locations_file, navigator=None, start_table=True):
+        self.id = map_id
+        self.navigator = navigator = navigator or FloorPlanNavigator(config_file)
+        config = navigator.config
+        # /api/navigate serves the phone app, so it may use a faster planner
+        self.navigate_planner = config.get('navigate_planner', navigator.planner)
+        if self.navigate_planner == 'hpa':
+            navigator.hierarchical
+        
+        # Saved locations in memory, persisted as the locations file plus an append-only log
+        self.location_store = LocationStore(
+            locations_file,
+            compact_every=config.get('locations_compact_every', 100),
+            index_cell=config.get('locations_index_cell', 1.0))
+        
+        # Routes between saved locations, precomputed in the background; a pre-fork
+        # parent fills the default map's table once before forking and workers never
+        # start one, so rows queued later are left to route searches
+        self.route_table = None
+        self.route_table_version = None
+        try:
+            self.route_table = RouteTable(navigator, config.get('route_table_planner', 'jps'), start=start_table)
+            self.route_table_version = self.location_store.version
+            self.route_table.update(self.location_store.all())
+        except Exception as e:
+            print(f"Error starting route table: {e}")
+            self.route_table = None
+        
+        # Recent routes by quantized start/goal, so repeats and position jitter skip the search
+        self.route_cache = RouteCache(
+            navigator,
+            quantization_pixels=round(config.get('route_cache_quantization', 0.05) / navigator.resolution),
+            max_entries=config.get('route_cache_max_entries', 1024),
+            max_bytes=int(config.get('route_cache_max_mb', 64) * 1024 * 1024))
+        
+        # Process pool for /api/find_path_batch, started on the first batch
+        self.batch_router = BatchRouter(config_file, navigator.planner, config.get('batch_workers'))
+        
+        # Stateful navigation: one incremental D* Lite planner per walking user
+        self.navigation_sessions = NavigationSessions(
+            navigator,
+            idle_timeout=config.get('session_idle_timeout', 300),
+            max_sessions=config.get('max_sessions', 64),
+            max_repair=config.get('dstar_max_repair', 20000))
+    
+    def memory_bytes(self):
+        """Arrays of the navigator (navigation sessions' fields included), cached routes and batch workers"""
+        return self.navigator.memory_bytes() + self.route_cache.stats()['bytes'] + self.batch_router.memory_bytes()
+    
+    def close(self):
+        if self.route_table:
+            self.route_table.stop()
+        self.batch_router.close()
+
+# Maps served by this process: the configured map, which is never evicted, and
+# any declared under `maps`, loaded on first use within map_memory_budget_mb
+DEFAULT_MAP = default_navigator.config.get('map_id', 'default') if default_navigator else 'default'
+default_map = None
+map_registry = None
+if default_navigator:
+    try:
+        maps = {DEFAULT_MAP: {'config': CONFIG_FILE, 'locations': LOCATIONS_FILE}}
+        maps.update(default_navigator.config.get('maps') or {})
+        map_registry = MapRegistry(
+            maps,
+            lambda map_id, spec: ServedMap(map_id, spec['config'], spec['locations'], start_table=not PREFORK),
+            memory_budget=int(default_navigator.config.get('map_memory_budget_mb', 2048) * 1024 * 1024),
+            connectors=default_navigator.config.get('connectors') or [],
+            pinned=[DEFAULT_MAP])
+        default_map = ServedMap(DEFAULT_MAP, CONFIG_FILE, LOCATIONS_FILE, default_navigator, start_table=not PREFORK)
+        map_registry.add(DEFAULT_MAP, default_map)
+    except Exception as e:
+        print(f"Error initializing maps: {e}")
+        default_map = None
+        map_registry = None
+
+# Without a navigator the saved locations are still served
+fallback_location_store = None if default_map else LocationStore(LOCATIONS_FILE)
+
+def current_map():
+    """The map the request picked with ?map= or "map" in its JSON body, else the default map"""
+    if has_request_context() and 'map' in g:
+        return g.map
+    return default_map
+
+@contextmanager
+def using_map(served):
+    """Resolve the per-map names below to another map inside the block"""
+    previous = g.get('map')
+    g.map = served
+    try:
+        yield
+    finally:
+        if previous is None:
+            g.pop('map', None)
+        else:
+            g.map = previous
+
+def map_attribute(name, fallback=None):
+    """A name that resolves to an attribute of the current request's map"""
+    return LocalProxy(lambda: getattr(current_map(), name, fallback))
+
+# The rest of the server uses these as if there were one map
+navigator = map_attribute('navigator')
+location_store = map_attribute('location_store', fallback_location_store)
+route_table = map_attribute('route_table')
+route_cache = map_attribute('route_cache')
+batch_router = map_attribute('batch_router')
+navigation_sessions = map_attribute('navigation_sessions')
+
+def map_setting(key, default=None):
+    """A setting from the current request's map config, read per request so each floor's YAML applies"""
+    return navigator.config.get(key, default) if navigator else default
+
+def sync_route_table():
+    """Update the route table when the locations changed, e.g. saved through another worker"""
+    served = current_map()
+    if not served or not served.route_table:
+        return
+    served.location_store.sync()
+    if served.location_store.version != served.route_table_version:
+        served.route_table_version = served.location_store.version
+        served.route_table.update(served.location_store.all())
+
+# Route responses are reduced to turn points unless a request sends simplify_tolerance: null
+TOLERANCE_ERROR = 'simplify_tolerance must be a non-negative number of meters or null'
+
+def simplify_tolerance(data):
+    """The request's simplification tolerance in pixels, or None to keep every cell"""
+    tolerance = data.get('simplify_tolerance', map_setting('simplify_tolerance'))
+    if tolerance is None:
+        return None
+    tolerance = float(tolerance)
+    if not tolerance >= 0:
+        raise ValueError(TOLERANCE_ERROR)
+    return tolerance / navigator.resolution
+
+def simplified(path, distance, tolerance):
+    """Collision-checked turn points of path and their exact Euclidean length"""
+    if tolerance is None or not path:
+        return path, distance
+    path = navigator.simplify_path(path, tolerance)
+    return path, navigator.calculate_path_length(path)
+
+def snap_requested(data):
+    """A dict to collect snapped endpoints in when the request snaps, else None"""
+    # Starts and goals inside inflated obstacles move to the nearest navigable cell
+    return {} if data.get('snap', bool(map_setting('snap_positions', False))) else None
+
+def point_to_pixels(point, snapped=None, label=None):
+    """Convert {'x', 'y'} in meters, or the name of a saved location, to pixels.
+    
+    With a ``snapped`` dict, a position outside the largest free region (inside
+    an inflated obstacle or in a pocket cut off from the main floor) is replaced
+    by the nearest navigable cell, if one is within snap_max_distance, and
+    recorded under label.
+    """
+    if isinstance(point, str):
+        sync_route_table()
+        cell = route_table.cell_of(point) if route_table else None
+        if cell is None:
+            raise KeyError(point)
+    else:
+        cell = navigator.meters_to_pixels(point['x'], point['y'])
+    if snapped is not None and not navigator.is_navigable(*cell):
+        targets, distances = navigator.snap_cells([cell])
+        if np.isfinite(distances[0]):
+            cell = (int(targets[0, 0]), int(targets[0, 1]))
+            x, y = navigator.pixels_to_meters(*cell)
+            snapped[label] = {'x': round(x, 3), 'y': round(y, 3), 'distance': round(float(distances[0]), 3)}
+    return cell
+
+def wants_compact_path(data):
+    """True when the request asks for the binary path encoding by parameter or Accept header"""
+    if 'format' in data:
+        return data['format'] == 'binary'
+    return request.accept_mimetypes.best_match(['application/json', path_encoding.MIMETYPE]) == path_encoding.MIMETYPE
+
+def compact_path_response(path, distance, planner, snapped=None):
+    """Binary path body (pixels, see path_encoding), gzip or deflate compressed if accepted"""
+    body = path_encoding.encode_path(path, distance, navigator.resolution)
+    encoding = request.accept_encodings.best_match(path_encoding.ENCODINGS)
+    if encoding:
+        body = path_encoding.compress(body, encoding)
+    response = Response(body, mimetype=path_encoding.MIMETYPE)
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['X-Route-Planner'] = planner
+    if snapped:
+        response.headers['X-Route-Snapped'] = json.dumps(snapped)
+    return response
+
+def route_source(source, planner, stats=None):
+    """Count where a route came from and, for searches, the planner's counters"""
+    metrics.inc('map_server_routes_total', 1, 'Routes answered by source', source=source, planner=planner)
+    g.search = dict(stats or {}, source=source, planner=planner)
+    if not stats:
+        return
+    for counter in ('expanded', 'pushes'):
+        if counter in stats:
+            metrics.inc(f'navigator_search_{counter}_total', stats[counter],
+                        f'Search {counter} summed over requests', planner=planner)
+    if 'open_peak' in stats:
+        metrics.set_max('navigator_search_open_peak_max', stats['open_peak'],
+                        'Largest open set seen by a search', planner=planner)
+
+def route_between(start_pixels, goal_pixels, planner, use_table):
+    """Return (path, distance, planner) from the route table, the route cache or a fresh search"""
+    if use_table and route_table:
+        sync_route_table()
+        cached = route_table.lookup(start_pixels, goal_pixels)
+        if cached == UNREACHABLE:
+            route_source('route_table', route_table.planner)
+            return None, 0.0, route_table.planner
+        if cached is not None:
+            route_source('route_table', route_table.planner)
+            return cached[0], cached[1], route_table.planner
+    
+    # Invalid endpoints are rejected before the cache so jitter cannot hide them
+    if not (navigator.is_valid_position(*start_pixels) and navigator.is_valid_position(*goal_pixels)):
+        route_source('invalid', planner)
+        return navigator.find_path(start_pixels, goal_pixels, planner), 0.0, planner
+    
+    if route_cache:
+        cached = route_cache.get(planner, start_pixels, goal_pixels)
+        if cached is not None:
+            route_source('route_cache', planner)
+            return cached[0], cached[1], planner
+    
+    stats = {}
+    generation = route_cache.generation if route_cache else None
+    started = time.perf_counter()
+    path = navigator.find_path(start_pixels, goal_pixels, planner, stats)
+    metrics.observe('navigator_search_seconds', time.perf_counter() - started,
+                    'Planner search time', planner=planner)
+    route_source('search', planner, stats)
+    distance = navigator.calculate_path_length(path) if path else 0.0
+    if route_cache:
+        route_cache.put(planner, start_pixels, goal_pixels, path, distance, generation)
+    if not path:
+        return None, 0.0, planner
+    return path, distance, planner
+
+@app.before_request
+def start_request_timer():
+    g.started = time.perf_counter()
+    g.phases = {}
+    g.search = None
+
+@app.before_request
+def select_map():
+    """Serve the request from the map named by ?map= or "map" in the JSON body"""
+    if request.method == 'OPTIONS' or not map_registry:
+        return None
+    map_id = request.args.get('map')
+    if map_id is None and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get('map'), str):
+            map_id = data['map']
+    if map_id is None or map_id == DEFAULT_MAP:
+        return None
+    # The map stays loaded until the request is torn down
+    g.held_maps = map_registry.hold()
+    try:
+        with phase('load_map'):
+            g.map = map_registry.get(map_id, g.held_maps)
+    except KeyError:
+        return jsonify({'error': f'Unknown map: {map_id}'}), 404
+
+# Endpoints whose state lives in one process: another pre-fork worker would not
+# know the session, anchor or device a client registered
+PER_PROCESS_ENDPOINTS = {
+    'create_navigation_session', 'update_navigation_session', 'delete_navigation_session',
+    'distance_remaining', 'register_anchor', 'get_anchors', 'get_anchor_changes',
+    'stream_anchor_changes', 'unregister_anchor',
+}
+
+@app.before_request
+def refuse_per_process_state():
+    """Reject the per-process endpoints when requests are spread over pre-fork workers"""
+    if PREFORK and request.method != 'OPTIONS' and request.endpoint in PER_PROCESS_ENDPOINTS:
+        return jsonify({'error': f'{request.path} keeps per-process state and needs server_workers: 1'}), 409
+
+@app.teardown_request
+def release_maps(error=None):
+    held = g.pop('held_maps', None)
+    if held is not None:
+        map_registry.release(held)
+
+@app.after_request
+def record_request_timing(response):
+    """Observe the request's latency and phases; streamed bodies are not included"""
+    elapsed = time.perf_counter() - g.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('map_server_request_seconds', elapsed, 'Request latency by route',
+                    route=route, method=request.method, status=response.status_code)
+    for name, seconds in g.phases.items():
+        metrics.observe('map_server_phase_seconds', seconds, 'Request time by phase', route=route, phase=name)
+    if REQUEST_LOG:
+        record = {
+            'route': route,
+            'method': request.method,
+            'status': response.status_code,
+            'ms': round(elapsed * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in g.phases.items()},
+        }
+        if g.search:
+            record['search'] = g.search
+        request_log.info(json.dumps(record))
+    return response
 
 @app.route('/')
 def index():
@@ -40,22 +409,31 @@ def serve_static(filename):
     except Exception as e:
         return str(e), 404
 
+def locations_response(body, etag, status=200):
+    """JSON response tagged with the locations' etag"""
+    response = jsonify(body)
+    response.status_code = status
+    response.set_etag(etag)
+    return response
+
+def location_error(e):
+    """Response for a failed location transaction"""
+    if isinstance(e, LocationConflict):
+        return locations_response({'error': str(e)}, e.etag, 412)
+    if isinstance(e, KeyError):
+        return jsonify({'error': f'Location not found: {e.args[0]}'}), 404
+    return jsonify({'error': str(e)}), 400
+
 @app.route('/api/locations', methods=['GET', 'OPTIONS'])
 @cross_origin()
 def get_locations():
-    """Get all saved locations"""
+    """Get all saved locations; answers 304 when If-None-Match has the current ETag"""
     if request.method == 'OPTIONS':
         return '', 204
     
     try:
-        if os.path.exists(LOCATIONS_FILE):
-            with open(LOCATIONS_FILE, 'r') as f:
-                locations = json.load(f)
-            print(f"Loaded {len(locations)} locations from {LOCATIONS_FILE}")
-        else:
-            locations = {}
-            print(f"No locations file found, returning empty dict")
-        return jsonify(locations)
+        locations, etag = location_store.state()
+        return locations_response(locations, etag).make_conditional(request)
     except Exception as e:
         print(f"Error loading locations: {e}")
         return jsonify({'error': str(e)}), 500
@@ -63,7 +441,7 @@ def get_locations():
 @app.route('/api/locations', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def save_locations():
-    """Save locations to file"""
+    """Replace all saved locations (If-Match makes the save conditional)"""
     if request.method == 'OPTIONS':
         return '', 204
     
@@ -71,17 +449,103 @@ def save_locations():
         locations = request.get_json()
         if locations is None:
             return jsonify({'error': 'No JSON data provided'}), 400
+        if not isinstance(locations, dict):
+            return jsonify({'error': 'Locations must be an object of name to {x, y}'}), 400
         
-        with open(LOCATIONS_FILE, 'w') as f:
-            json.dump(locations, f, indent=2)
+        try:
+            etag = location_store.transaction(replace=locations, if_match=request.headers.get('If-Match'))
+        except (LocationConflict, ValueError) as e:
+            return location_error(e)
+        sync_route_table()
         
-        print(f"Saved {len(locations)} locations to {LOCATIONS_FILE}")
-        return jsonify({'status': 'success', 'count': len(locations)})
+        print(f"Saved {len(locations)} locations to {location_store.path}")
+        return locations_response({'status': 'success', 'count': len(locations)}, etag)
     except Exception as e:
         print(f"Error saving locations: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/locations', methods=['PATCH'])
+@cross_origin()
+def update_locations():
+    """Apply {'upsert': {name: {x, y, ...}}, 'delete': [name, ...]} as one transaction"""
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'No JSON data provided'}), 400
+        upserts = data.get('upsert', {})
+        deletes = data.get('delete', [])
+        if not isinstance(upserts, dict) or not isinstance(deletes, list):
+            return jsonify({'error': 'upsert must be an object and delete a list'}), 400
+        
+        try:
+            etag = location_store.transaction(upserts, deletes, if_match=request.headers.get('If-Match'))
+        except (LocationConflict, KeyError, ValueError) as e:
+            return location_error(e)
+        sync_route_table()
+        
+        print(f"Updated locations in {location_store.path}: {len(upserts)} saved, {len(deletes)} deleted")
+        return locations_response({'status': 'success', 'upserted': len(upserts), 'deleted': len(deletes),
+                                   'count': len(location_store.all())}, etag)
+    except Exception as e:
+        print(f"Error updating locations: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/locations/<name>', methods=['PUT', 'DELETE'])
+@cross_origin()
+def save_location(name):
+    """Save or delete one location"""
+    try:
+        if request.method == 'PUT':
+            location = request.get_json()
+            upserts, deletes = {name: location}, []
+        else:
+            upserts, deletes = {}, [name]
+        
+        try:
+            etag = location_store.transaction(upserts, deletes, if_match=request.headers.get('If-Match'))
+        except (LocationConflict, KeyError, ValueError) as e:
+            return location_error(e)
+        sync_route_table()
+        
+        print(f"{'Saved' if upserts else 'Deleted'} location {name} in {location_store.path}")
+        return locations_response({'status': 'success', 'name': name, 'location': location_store.get(name)}, etag)
+    except Exception as e:
+        print(f"Error saving location {name}: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/locations/nearest', methods=['GET', 'OPTIONS'])
+@cross_origin()
+def nearest_locations():
+    """Saved locations closest to ?x=&y= (meters), up to ?k= of them within ?max_distance="""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        x = request.args.get('x', type=float)
+        y = request.args.get('y', type=float)
+        if x is None or y is None or not (math.isfinite(x) and math.isfinite(y)):
+            return jsonify({'error': 'Missing finite numeric x and y parameters'}), 400
+        k = request.args.get('k', 1, type=int)
+        if k is None or k < 1:
+            return jsonify({'error': 'k must be a positive integer'}), 400
+        max_distance = request.args.get('max_distance', type=float)
+        if 'max_distance' in request.args and (max_distance is None or not max_distance >= 0):
+            return jsonify({'error': 'max_distance must be a non-negative number of meters'}), 400
+        
+        location_store.sync()
+        nearest = []
+        for name, distance in location_store.nearest(x, y, k, max_distance):
+            location = location_store.get(name)
+            if location is not None:
+                nearest.append(dict(location, name=name, distance=round(distance, 3)))
+        return jsonify({'locations': nearest})
+    except Exception as e:
+        print(f"Error finding nearest locations: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/validate_position', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def validate_position():
@@ -100,16 +564,67 @@ def validate_position():
         x_meters = float(data['x'])
         y_meters = float(data['y'])
         
-        x_pixels, y_pixels = navigator.meters_to_pixels(x_meters, y_meters)
-        is_valid = navigator.is_valid_position(x_pixels, y_pixels)
+        return jsonify(validation_results([navigator.meters_to_pixels(x_meters, y_meters)])[0])
+    except Exception as e:
+        print(f"Error validating position: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def validation_results(cells):
+    """Validity, reachability and the nearest navigable cell for each pixel cell"""
+    targets, distances = navigator.snap_cells(cells)
+    results = []
+    for (x, y), target, distance in zip(cells, targets.tolist(), distances.tolist()):
+        result = {
+            'valid': bool(navigator.is_valid_position(x, y)),
+            # Free cells cut off from the main floor by inflation are not reachable
+            'reachable': distance == 0,
+            'x_pixels': x,
+            'y_pixels': y,
+            'nearest': None
+        }
+        if target[0] >= 0:
+            nearest_x, nearest_y = navigator.pixels_to_meters(*target)
+            result['nearest'] = {'x': round(nearest_x, 3), 'y': round(nearest_y, 3), 'x_pixels': target[0],
+                                 'y_pixels': target[1], 'distance': round(distance, 3)}
+        results.append(result)
+    return results
+
+@app.route('/api/validate_positions', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def validate_positions():
+    """Validate many positions at once and suggest the nearest navigable cell for each.
+    
+    Takes {'positions': [{'x', 'y'}, ...]} or {'positions': {name: {'x', 'y'}, ...}}
+    (the locations file format) and answers in the same shape.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not navigator:
+            return jsonify({'error': 'Navigator not initialized'}), 500
         
+        data = request.get_json()
+        positions = data.get('positions') if isinstance(data, dict) else None
+        if not isinstance(positions, (list, dict)):
+            return jsonify({'error': 'Missing positions list or object'}), 400
+        names = list(positions) if isinstance(positions, dict) else None
+        points = [positions[name] for name in names] if names is not None else positions
+        try:
+            cells = [navigator.meters_to_pixels(float(p['x']), float(p['y'])) for p in points]
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Every position needs numeric x and y: {e}'}), 400
+        
+        results = validation_results(cells)
+        invalid = sum(1 for result in results if not result['valid'])
+        unreachable = sum(1 for result in results if not result['reachable'])
         return jsonify({
-            'valid': is_valid,
-            'x_pixels': x_pixels,
-            'y_pixels': y_pixels
+            'results': dict(zip(names, results)) if names is not None else results,
+            'invalid': invalid,
+            'unreachable': unreachable
         })
     except Exception as e:
-        print(f"Error validating position: {e}")
+        print(f"Error validating positions: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/find_path', methods=['POST', 'OPTIONS'])
@@ -123,48 +638,146 @@ def find_path():
         if not navigator:
             return jsonify({'error': 'Navigator not initialized'}), 500
         
-        data = request.get_json()
+        with phase('parse'):
+            data = request.get_json()
         if not data or 'start' not in data or 'goal' not in data:
             return jsonify({'error': 'Missing start or goal coordinates'}), 400
         
         start = data['start']
         goal = data['goal']
+        planner = data.get('planner', navigator.planner)
+        if planner not in PLANNERS:
+            return jsonify({'error': f'Unknown planner: {planner}'}), 400
+        try:
+            tolerance = simplify_tolerance(data)
+        except (TypeError, ValueError):
+            return jsonify({'error': TOLERANCE_ERROR}), 400
         
-        # Convert to pixels
-        start_pixels = navigator.meters_to_pixels(start['x'], start['y'])
-        goal_pixels = navigator.meters_to_pixels(goal['x'], goal['y'])
-        
-        print(f"Finding path from {start_pixels} to {goal_pixels}")
-        
-        # Find path
-        path = navigator.find_path(start_pixels, goal_pixels)
-        
-        if path:
-            # Calculate distance
-            distance = navigator.calculate_path_length(path)
-            
-            # Convert path to list for JSON serialization
-            path_list = [[int(p[0]), int(p[1])] for p in path]
-            
-            print(f"Path found: {distance:.2f}m with {len(path)} waypoints")
-            
-            return jsonify({
-                'success': True,
-                'path': path_list,
-                'distance': round(distance, 2),
-                'waypoints': len(path)
-            })
-        else:
-            print("No path found")
-            return jsonify({
-                'success': False,
-                'error': 'No path found'
-            })
+        # Convert to pixels (start/goal may also be saved location names)
+        snapped = snap_requested(data)
+        try:
+            with phase('convert'):
+                start_pixels = point_to_pixels(start, snapped, 'start')
+                goal_pixels = point_to_pixels(goal, snapped, 'goal')
+        except KeyError as e:
+            return jsonify({'error': f'Unknown location or missing coordinate: {e}'}), 400
+        
+        # Find path, served from the route table unless a planner was requested;
+        # the request log (request_log) replaces the per-request prints
+        with phase('search'):
+            path, distance, planner = route_between(start_pixels, goal_pixels, planner, 'planner' not in data)
+        with phase('simplify'):
+            path, distance = simplified(path, distance, tolerance)
+        
+        with phase('serialize'):
+            if path and wants_compact_path(data):
+                return compact_path_response(path, distance, planner, snapped)
+            if path:
+                result = {
+                    'success': True,
+                    'path': np.asarray(path, dtype=np.int64).tolist(),
+                    'distance': round(distance, 2),
+                    'waypoints': len(path),
+                    'planner': planner
+                }
+            else:
+                result = {
+                    'success': False,
+                    'error': 'No path found'
+                }
+            if snapped:
+                result['snapped'] = snapped
+            return jsonify(result)
     except Exception as e:
         print(f"Error finding path: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/find_path_batch', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def find_path_batch():
+    """Find paths for a list of start/goal pairs, streamed as NDJSON lines in completion order"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not batch_router:
+            return jsonify({'error': 'Navigator not initialized'}), 500
+        
+        with phase('parse'):
+            data = request.get_json()
+        if not data or not isinstance(data.get('routes'), list):
+            return jsonify({'error': 'Missing routes list'}), 400
+        routes = data['routes']
+        max_routes = map_setting('batch_max_routes', 1000)
+        if len(routes) > max_routes:
+            return jsonify({'error': f'At most {max_routes} routes per batch'}), 400
+        
+        planner = data.get('planner')
+        if planner is not None and planner not in PLANNERS:
+            return jsonify({'error': f'Unknown planner: {planner}'}), 400
+        include_path = bool(data.get('include_path', True))
+        try:
+            tolerance = simplify_tolerance(data)
+        except (TypeError, ValueError):
+            return jsonify({'error': TOLERANCE_ERROR}), 400
+        
+        # Bad items and saved-location pairs are answered here; the rest go to the pool
+        ready = []
+        pending = []
+        snap = snap_requested(data) is not None
+        snapped_items = {}
+        for index, item in enumerate(routes):
+            if not isinstance(item, dict):
+                ready.append({'index': index, 'success': False, 'error': 'Route must be an object with start and goal'})
+                continue
+            snapped = {} if snap else None
+            try:
+                with phase('convert'):
+                    start_pixels = point_to_pixels(item['start'], snapped, 'start')
+                    goal_pixels = point_to_pixels(item['goal'], snapped, 'goal')
+            except (KeyError, TypeError, ValueError) as e:
+                ready.append({'index': index, 'success': False, 'error': f'Unknown location or missing coordinate: {e}'})
+                continue
+            if snapped:
+                snapped_items[index] = snapped
+            if not navigator.is_valid_position(*start_pixels):
+                ready.append({'index': index, 'success': False, 'error': 'Start position is invalid'})
+                continue
+            if not navigator.is_valid_position(*goal_pixels):
+                ready.append({'index': index, 'success': False, 'error': 'Goal position is invalid'})
+                continue
+            if planner is None and route_table:
+                sync_route_table()
+                cached = route_table.lookup(start_pixels, goal_pixels)
+                if cached is not None:
+                    path, distance = (None, 0.0) if cached == UNREACHABLE else simplified(*cached, tolerance)
+                    ready.append(route_result(index, path, distance, route_table.planner, include_path))
+                    continue
+            pending.append((index, start_pixels, goal_pixels))
+        
+        metrics.inc('map_server_batch_routes_total', len(routes) - len(pending),
+                    'Batch routes by where they were answered', answered='server')
+        metrics.inc('map_server_batch_routes_total', len(pending),
+                    'Batch routes by where they were answered', answered='pool')
+        
+        def generate():
+            for result in ready:
+                if result['index'] in snapped_items:
+                    result['snapped'] = snapped_items[result['index']]
+                yield json.dumps(result) + '\n'
+            if pending:
+                for result in batch_router.route(pending, planner, include_path, tolerance):
+                    if result['index'] in snapped_items:
+                        result['snapped'] = snapped_items[result['index']]
+                    yield json.dumps(result) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    except Exception as e:
+        print(f"Error in find_path_batch: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/map_info', methods=['GET', 'OPTIONS'])
 @cross_origin()
 def get_map_info():
@@ -189,6 +802,81 @@ def get_map_info():
         print(f"Error getting map info: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/route_table', methods=['GET', 'OPTIONS'])
+@cross_origin()
+def get_route_table():
+    """Get precomputed distances between saved locations"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not route_table:
+            return jsonify({'error': 'Route table not initialized'}), 500
+        
+        sync_route_table()
+        status = route_table.status()
+        status['distances'] = route_table.distances()
+        return jsonify(status)
+    except Exception as e:
+        print(f"Error getting route table: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/route_cache', methods=['GET', 'OPTIONS'])
+@cross_origin()
+def get_route_cache():
+    """Get route cache size and hit/miss counters"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    if not route_cache:
+        return jsonify({'error': 'Navigator not initialized'}), 500
+    return jsonify(route_cache.stats())
+
+@app.route('/api/maps', methods=['GET', 'OPTIONS'])
+@cross_origin()
+def get_maps():
+    """Declared maps with their load state and memory, and the connectors between them"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    if not map_registry:
+        return jsonify({'error': 'Navigator not initialized'}), 500
+    return jsonify({
+        'default': DEFAULT_MAP,
+        'maps': map_registry.status(),
+        'memory_budget_mb': round(map_registry.memory_budget / (1024 * 1024), 1),
+        'connectors': [{'id': connector_id, 'cost': connector['cost'], 'maps': sorted(connector['points'])}
+                       for connector_id, connector in map_registry.connectors.items()]
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request latency histograms, planner and cache counters in Prometheus text format"""
+    if route_cache:
+        cache = route_cache.stats()
+        for name in ('hits', 'misses', 'evictions', 'invalidations'):
+            metrics.set(f'route_cache_{name}_total', cache[name], f'Route cache {name}', kind='counter')
+        metrics.set('route_cache_entries', cache['entries'], 'Routes held by the route cache')
+        metrics.set('route_cache_bytes', cache['bytes'], 'Memory held by the route cache')
+    if navigator and navigator._flow_fields is not None:
+        fields = navigator.flow_fields.stats()
+        metrics.set('flow_field_cache_hits_total', fields['hits'], 'Distance field cache hits', kind='counter')
+        metrics.set('flow_field_cache_misses_total', fields['misses'], 'Distance field cache misses', kind='counter')
+        metrics.set('flow_field_cache_bytes', fields['bytes'], 'Memory held by cached distance fields')
+    if map_registry:
+        loaded = [status for status in map_registry.status() if status['loaded']]
+        metrics.set('maps_loaded', len(loaded), 'Maps held in memory')
+        metrics.set('maps_memory_bytes', int(sum(status['memory_mb'] for status in loaded) * 1024 * 1024),
+                    'Estimated memory held by loaded maps')
+        metrics.set('map_loads_total', map_registry.loads, 'Maps loaded on demand', kind='counter')
+        metrics.set('map_evictions_total', map_registry.evictions, 'Maps evicted over map_memory_budget_mb',
+                    kind='counter')
+    anchors = anchor_registry.stats()
+    metrics.set('anchors_active', anchors['anchors'], 'Registered anchors that have not expired')
+    metrics.set('anchors_expired_total', anchors['expired'], 'Anchors dropped after anchor_ttl', kind='counter')
+    metrics.set('anchors_evicted_total', anchors['evicted'], 'Anchors dropped over max_anchors', kind='counter')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/test', methods=['GET'])
 @cross_origin()
 def test_endpoint():
@@ -197,6 +885,18 @@ def test_endpoint():
 
 # Navigation endpoints for Swift app
 
+def navigation_result(path, distance, planner):
+    """Response body for a path sent to the navigation app"""
+    return {
+        'success': True,
+        # Meters, like pixels_to_meters, for the whole path at once
+        'path': (np.asarray(path, dtype=np.float64) * navigator.resolution).tolist(),
+        'distance': round(distance, 2),
+        'waypoints': len(path),
+        'estimated_time': round(distance / 1.2, 0),  # 1.2 m/s walking speed
+        'planner': planner
+    }
+
 @app.route('/api/navigate', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def navigate():
@@ -205,48 +905,435 @@ def navigate():
         return '', 204
     
     try:
-        data = request.get_json()
+        with phase('parse'):
+            data = request.get_json()
         if not data or 'start' not in data or 'goal' not in data:
             return jsonify({'error': 'Missing start or goal coordinates'}), 400
         
         start = data['start']
         goal = data['goal']
+        planner = data.get('planner', current_map().navigate_planner if navigator else None)
+        if planner not in PLANNERS:
+            return jsonify({'error': f'Unknown planner: {planner}'}), 400
+        try:
+            tolerance = simplify_tolerance(data)
+        except (TypeError, ValueError):
+            return jsonify({'error': TOLERANCE_ERROR}), 400
         
         # This is the same as find_path but with cleaner response format
-        start_pixels = navigator.meters_to_pixels(start['x'], start['y'])
-        goal_pixels = navigator.meters_to_pixels(goal['x'], goal['y'])
-        
-        path = navigator.find_path(start_pixels, goal_pixels)
-        
-        if path:
-            distance = navigator.calculate_path_length(path)
-            # Convert path to meters for consistency
-            path_meters = [[navigator.pixels_to_meters(p[0], p[1])[0], 
-                           navigator.pixels_to_meters(p[0], p[1])[1]] for p in path]
-            
-            return jsonify({
-                'success': True,
-                'path': path_meters,
-                'distance': round(distance, 2),
-                'waypoints': len(path),
-                'estimated_time': round(distance / 1.2, 0)  # 1.2 m/s walking speed
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'No path found between specified points'
-            })
+        snapped = snap_requested(data)
+        start_map, goal_map = point_map(start), point_map(goal)
+        if map_registry and (start_map != goal_map or start_map != point_map(None)):
+            return navigate_between_maps(start, goal, start_map, goal_map, planner, tolerance, snapped)
+        
+        try:
+            with phase('convert'):
+                start_pixels = point_to_pixels(start, snapped, 'start')
+                goal_pixels = point_to_pixels(goal, snapped, 'goal')
+        except KeyError as e:
+            return jsonify({'error': f'Unknown location or missing coordinate: {e}'}), 400
+        
+        with phase('search'):
+            path, distance, planner = route_between(start_pixels, goal_pixels, planner, 'planner' not in data)
+        with phase('simplify'):
+            path, distance = simplified(path, distance, tolerance)
+        
+        with phase('serialize'):
+            if path and wants_compact_path(data):
+                return compact_path_response(path, distance, planner, snapped)
+            if path:
+                result = navigation_result(path, distance, planner)
+            else:
+                result = {
+                    'success': False,
+                    'error': 'No path found between specified points'
+                }
+            if snapped:
+                result['snapped'] = snapped
+            return jsonify(result)
     except Exception as e:
         print(f"Error in navigate: {e}")
         return jsonify({'error': str(e)}), 500
 
-# Active anchors tracking
-active_anchors = {}
+def point_map(point):
+    """Map id of a navigate endpoint: its own "map" if it has one, else the request's map"""
+    if isinstance(point, dict) and 'map' in point:
+        return str(point['map'])
+    return current_map().id if current_map() else DEFAULT_MAP
+
+def navigate_between_maps(start, goal, start_map, goal_map, planner, tolerance, snapped):
+    """Route across floors through the declared connectors, one leg per floor walked"""
+    # Every map the route passes through stays loaded until the request ends
+    held = g.get('held_maps')
+    if held is None:
+        held = g.held_maps = map_registry.hold()
+    try:
+        with phase('load_map'):
+            served = {map_id: map_registry.get(map_id, held) for map_id in (start_map, goal_map)}
+    except KeyError as e:
+        return jsonify({'error': f'Unknown map: {e.args[0]}'}), 404
+    try:
+        with phase('convert'):
+            with using_map(served[start_map]):
+                start_pixels = point_to_pixels(start, snapped, 'start')
+                start_valid = navigator.is_valid_position(*start_pixels)
+            with using_map(served[goal_map]):
+                goal_pixels = point_to_pixels(goal, snapped, 'goal')
+                goal_valid = navigator.is_valid_position(*goal_pixels)
+    except KeyError as e:
+        return jsonify({'error': f'Unknown location or missing coordinate: {e}'}), 400
+    if not (start_valid and goal_valid):
+        return jsonify({'success': False, 'error': 'Start or goal position is invalid'})
+    
+    with phase('plan_maps'):
+        if start_map == goal_map:
+            plan = (0.0, [{'map': start_map, 'start': start_pixels, 'goal': goal_pixels, 'connector': None}])
+        else:
+            plan = map_registry.plan(start_map, start_pixels, goal_map, goal_pixels, held)
+    if plan is None:
+        return jsonify({'success': False, 'error': 'No connector joins the start and goal maps'})
+    
+    legs = []
+    for leg in plan[1]:
+        with using_map(map_registry.get(leg['map'], held)):
+            with phase('search'):
+                path, distance, leg_planner = route_between(leg['start'], leg['goal'], planner, False)
+            if not path:
+                return jsonify({'success': False, 'error': f"No path found on map {leg['map']}"})
+            with phase('simplify'):
+                path, distance = simplified(path, distance, tolerance)
+            with phase('serialize'):
+                result = navigation_result(path, distance, leg_planner)
+        result.update(map=leg['map'], connector=leg['connector'])
+        legs.append(result)
+    
+    walked = sum(leg['distance'] for leg in legs)
+    connector_cost = sum(map_registry.connectors[leg['connector']]['cost'] for leg in legs if leg['connector'])
+    result = {
+        'success': True,
+        'legs': legs,
+        'distance': round(walked, 2),
+        'estimated_time': round((walked + connector_cost) / 1.2, 0),  # connector cost is in walking meters
+        'maps': [leg['map'] for leg in legs]
+    }
+    if snapped:
+        result['snapped'] = snapped
+    return jsonify(result)
+
+def session_route(planner, position, tolerance, snapped=None, compact=False):
+    """Move a session's start to position and return the repaired route response"""
+    with phase('convert'):
+        position_pixels = point_to_pixels(position, snapped, 'position')
+    if not navigator.is_valid_position(*position_pixels):
+        return jsonify({'success': False, 'error': 'Position is invalid'})
+    
+    with phase('search'):
+        path = planner.plan_from(position_pixels)
+    if not path:
+        return jsonify({'success': False, 'error': 'No path found between specified points'})
+    
+    with phase('simplify'):
+        path, distance = simplified(path, navigator.calculate_path_length(path), tolerance)
+    with phase('serialize'):
+        if compact:
+            return compact_path_response(path, distance, 'dstar_lite', snapped)
+        result = navigation_result(path, distance, 'dstar_lite')
+        if snapped:
+            result['snapped'] = snapped
+        return jsonify(result)
+
+@app.route('/api/navigation_sessions', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def create_navigation_session():
+    """Start a navigation session toward a goal; optional initial position"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not navigation_sessions:
+            return jsonify({'error': 'Navigator not initialized'}), 500
+        
+        data = request.get_json()
+        if not data or 'goal' not in data:
+            return jsonify({'error': 'Missing goal'}), 400
+        try:
+            tolerance = simplify_tolerance(data)
+        except (TypeError, ValueError):
+            return jsonify({'error': TOLERANCE_ERROR}), 400
+        
+        snapped = snap_requested(data)
+        try:
+            goal_pixels = point_to_pixels(data['goal'], snapped, 'goal')
+        except KeyError as e:
+            return jsonify({'error': f'Unknown location or missing coordinate: {e}'}), 400
+        if not navigator.is_valid_position(*goal_pixels):
+            return jsonify({'error': 'Goal position is invalid'}), 400
+        
+        session_id = navigation_sessions.create(goal_pixels)
+        print(f"Created navigation session {session_id} to {goal_pixels}")
+        
+        result = {'session_id': session_id, 'idle_timeout': navigation_sessions.idle_timeout}
+        if snapped:
+            result['snapped'] = snapped
+        if 'position' in data:
+            route = session_route(navigation_sessions.get(session_id), data['position'], tolerance,
+                                  snapped).get_json()
+            result.update(route)
+        return jsonify(result)
+    except KeyError as e:
+        return jsonify({'error': f'Unknown location or missing coordinate: {e}'}), 400
+    except Exception as e:
+        print(f"Error creating navigation session: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/navigation_sessions/<session_id>/position', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def update_navigation_session(session_id):
+    """Report a new position for a session and get the repaired route"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not navigation_sessions:
+            return jsonify({'error': 'Navigator not initialized'}), 500
+        
+        planner = navigation_sessions.get(session_id)
+        if planner is None:
+            return jsonify({'error': 'Session not found or expired'}), 404
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing position'}), 400
+        try:
+            tolerance = simplify_tolerance(data)
+        except (TypeError, ValueError):
+            return jsonify({'error': TOLERANCE_ERROR}), 400
+        
+        return session_route(planner, data.get('position', data), tolerance, snap_requested(data),
+                             wants_compact_path(data))
+    except KeyError as e:
+        return jsonify({'error': f'Unknown location or missing coordinate: {e}'}), 400
+    except Exception as e:
+        print(f"Error updating navigation session: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/navigation_sessions/<session_id>', methods=['DELETE', 'OPTIONS'])
+@cross_origin()
+def delete_navigation_session(session_id):
+    """End a navigation session"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if navigation_sessions and navigation_sessions.delete(session_id):
+            print(f"Deleted navigation session {session_id}")
+            return jsonify({'success': True})
+        return jsonify({'error': 'Session not found or expired'}), 404
+    except Exception as e:
+        print(f"Error deleting navigation session: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/distance_remaining', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def distance_remaining():
+    """Distance from the current position to a goal, read from the goal's cached distance field"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not navigator:
+            return jsonify({'error': 'Navigator not initialized'}), 500
+        
+        with phase('parse'):
+            data = request.get_json()
+        if not data or 'position' not in data or 'goal' not in data:
+            return jsonify({'error': 'Missing position or goal'}), 400
+        
+        snapped = snap_requested(data)
+        try:
+            with phase('convert'):
+                position_pixels = point_to_pixels(data['position'], snapped, 'position')
+                goal_pixels = point_to_pixels(data['goal'], snapped, 'goal')
+        except KeyError as e:
+            return jsonify({'error': f'Unknown location or missing coordinate: {e}'}), 400
+        
+        if not navigator.is_valid_position(*goal_pixels):
+            return jsonify({'error': 'Goal position is invalid'}), 400
+        if not navigator.is_valid_position(*position_pixels):
+            return jsonify({'success': False, 'error': 'Position is invalid'})
+        
+        with phase('search'):
+            distance = navigator.flow_fields.distance(position_pixels, goal_pixels)
+        if distance is None:
+            return jsonify({'success': False, 'error': 'Goal is not reachable from position'})
+        
+        result = {
+            'success': True,
+            'distance': round(distance, 2),
+            'estimated_time': round(distance / 1.2, 0)  # 1.2 m/s walking speed
+        }
+        if snapped:
+            result['snapped'] = snapped
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error in distance_remaining: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Runtime obstacles: moved furniture, temporarily blocked corridors
+
+def obstacle_polygon(data):
+    """Pixel vertices from {'rect': {'x', 'y', 'width', 'height'}} or
+    {'polygon': [{'x', 'y'}, ...]} in meters"""
+    if 'rect' in data:
+        rect = data['rect']
+        x, y = float(rect['x']), float(rect['y'])
+        width, height = float(rect['width']), float(rect['height'])
+        if not (width > 0 and height > 0):
+            raise ValueError('rect width and height must be positive')
+        # Every pixel the rectangle overlaps; polygon vertices are inclusive
+        x0, y0 = navigator.meters_to_pixels(x, y)
+        x1 = max(x0, math.ceil((x + width) / navigator.resolution) - 1)
+        y1 = max(y0, math.ceil((y + height) / navigator.resolution) - 1)
+        return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    if 'polygon' in data:
+        points = [(p['x'], p['y']) if isinstance(p, dict) else (p[0], p[1]) for p in data['polygon']]
+        return [navigator.meters_to_pixels(float(x), float(y)) for x, y in points]
+    raise KeyError('rect or polygon')
+
+def apply_map_change(change):
+    """Drop the routes a map change may have broken and repair navigation sessions"""
+    result = {'changed_cells': 0, 'invalidated_routes': 0, 'invalidated_table_routes': 0}
+    # Batch workers load their own navigator, so they are restarted with the new obstacles
+    if batch_router:
+        batch_router.set_obstacles(navigator.obstacles)
+    if change is None:
+        return result
+    
+    def affected(path):
+        return navigator.route_affected(path, change)
+    
+    result['changed_cells'] = len(change['cells'])
+    x0, y0, x1, y1 = change['region']
+    (left, top), (right, bottom) = navigator.pixels_to_meters(x0, y0), navigator.pixels_to_meters(x1, y1)
+    result['region'] = {'x': left, 'y': top, 'width': right - left, 'height': bottom - top}
+    if route_cache:
+        result['invalidated_routes'] = route_cache.invalidate(affected)
+    if route_table:
+        result['invalidated_table_routes'] = route_table.invalidate(affected)
+    if navigation_sessions:
+        navigation_sessions.update_cells(change['cells'].tolist())
+    return result
+
+def obstacle_result(obstacle_id):
+    points = navigator.obstacles[obstacle_id]
+    return {'id': obstacle_id, 'polygon': [dict(zip(('x', 'y'), navigator.pixels_to_meters(int(x), int(y))))
+                                           for x, y in points]}
+
+@app.route('/api/obstacles', methods=['GET', 'OPTIONS'])
+@cross_origin()
+def get_obstacles():
+    """List the obstacles added at runtime"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    if not navigator:
+        return jsonify({'error': 'Navigator not initialized'}), 500
+    return jsonify({'obstacles': [obstacle_result(oid) for oid in list(navigator.obstacles)]})
+
+@app.route('/api/obstacles', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def add_obstacle():
+    """Block a rectangle or polygon (meters); an existing id is moved"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not navigator:
+            return jsonify({'error': 'Navigator not initialized'}), 500
+        if PREFORK:
+            return jsonify({'error': 'Obstacle updates need server_workers: 1'}), 409
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing rect or polygon'}), 400
+        try:
+            polygon = obstacle_polygon(data)
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            return jsonify({'error': f'Invalid obstacle, expected rect or polygon in meters: {e}'}), 400
+        
+        try:
+            obstacle_id, change = navigator.add_obstacle(polygon, data.get('id'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        result = apply_map_change(change)
+        print(f"Added obstacle {obstacle_id}: {result['changed_cells']} cells changed, "
+              f"{result['invalidated_routes'] + result['invalidated_table_routes']} routes invalidated")
+        
+        result.update(success=True, **obstacle_result(obstacle_id))
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error adding obstacle: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/obstacles/<obstacle_id>', methods=['DELETE', 'OPTIONS'])
+@cross_origin()
+def remove_obstacle(obstacle_id):
+    """Remove an obstacle added at runtime"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not navigator:
+            return jsonify({'error': 'Navigator not initialized'}), 500
+        if PREFORK:
+            return jsonify({'error': 'Obstacle updates need server_workers: 1'}), 409
+        
+        try:
+            change = navigator.remove_obstacle(obstacle_id)
+        except KeyError:
+            return jsonify({'error': 'Obstacle not found'}), 404
+        result = apply_map_change(change)
+        print(f"Removed obstacle {obstacle_id}: {result['changed_cells']} cells changed, "
+              f"{result['invalidated_routes'] + result['invalidated_table_routes']} routes invalidated")
+        
+        result.update(success=True, id=obstacle_id)
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error removing obstacle: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def anchor_poll_timeout():
+    """Longest a change request on the current map may wait for something to report"""
+    return float(map_setting('anchor_poll_timeout', 25.0))
+
+def per_map(build):
+    """A name resolving to the current map's instance of build(), kept when the map is evicted.
+    
+    build() runs while the map is current, so it reads that map's settings.
+    """
+    instances = {}
+    lock = threading.Lock()
+    
+    def instance():
+        map_id = current_map().id if current_map() else DEFAULT_MAP
+        with lock:
+            if map_id not in instances:
+                instances[map_id] = build()
+            return instances[map_id]
+    return LocalProxy(instance)
+
+# Anchor devices, expired on server time; changes are fed to clients by version
+anchor_registry = per_map(lambda: AnchorRegistry(
+    ttl=map_setting('anchor_ttl', 60),
+    max_anchors=map_setting('max_anchors', 1024),
+    max_changes=map_setting('anchor_change_log', 1024)))
 
 @app.route('/api/anchors/register', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def register_anchor():
-    """Register an anchor device with its position"""
+    """Register an anchor device with its position; repeat within anchor_ttl to stay active"""
     if request.method == 'OPTIONS':
         return '', 204
     
@@ -255,20 +1342,15 @@ def register_anchor():
         if not data or 'id' not in data or 'x' not in data or 'y' not in data:
             return jsonify({'error': 'Missing anchor data'}), 400
         
-        anchor_id = data['id']
-        active_anchors[anchor_id] = {
-            'x': data['x'],
-            'y': data['y'],
-            'timestamp': data.get('timestamp', 0),
-            'active': True
-        }
-        
-        print(f"Registered anchor: {anchor_id} at ({data['x']}, {data['y']})")
+        anchor_id = str(data['id'])
+        anchor = anchor_registry.register(anchor_id, data['x'], data['y'])
         
         return jsonify({
             'success': True,
             'message': f'Anchor {anchor_id} registered',
-            'total_anchors': len(active_anchors)
+            'total_anchors': anchor_registry.stats()['anchors'],
+            'lastSeen': anchor['lastSeen'],
+            'ttl': anchor_registry.ttl
         })
     except Exception as e:
         print(f"Error registering anchor: {e}")
@@ -277,31 +1359,83 @@ def register_anchor():
 @app.route('/api/anchors/status', methods=['GET', 'OPTIONS'])
 @cross_origin()
 def get_anchors():
-    """Get list of active anchor positions"""
+    """Get list of active anchor positions; X-Anchor-Version is the version to ask changes from"""
     if request.method == 'OPTIONS':
         return '', 204
     
     try:
-        import time
-        current_time = time.time()
-        
-        # Filter out anchors that haven't been seen in 60 seconds
-        active_list = []
-        for anchor_id, data in active_anchors.items():
-            if current_time - data.get('timestamp', 0) < 60:
-                active_list.append({
-                    'id': anchor_id,
-                    'x': data['x'],
-                    'y': data['y'],
-                    'active': True,
-                    'lastSeen': data.get('timestamp', 0)
-                })
-        
-        return jsonify(active_list)
+        version, anchors = anchor_registry.snapshot()
+        response = jsonify(anchors)
+        response.headers['X-Anchor-Version'] = str(version)
+        return response
     except Exception as e:
         print(f"Error getting anchors: {e}")
         return jsonify({'error': str(e)}), 500
 
+def anchor_changes_since(since, timeout):
+    """Response body for the changes after version since, or a full snapshot"""
+    version, changes = anchor_registry.changes(since, timeout)
+    if changes is None:
+        version, anchors = anchor_registry.snapshot()
+        return {'version': version, 'reset': True, 'anchors': anchors}
+    return {'version': version, 'changes': changes}
+
+@app.route('/api/anchors/changes', methods=['GET', 'OPTIONS'])
+@cross_origin()
+def get_anchor_changes():
+    """Long-poll for anchor changes after ?since=<version>, waiting up to ?timeout= seconds"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'error': 'Missing integer since parameter'}), 400
+        longest = anchor_poll_timeout()
+        timeout = min(max(request.args.get('timeout', longest, type=float), 0.0), longest)
+        return jsonify(anchor_changes_since(since, timeout))
+    except Exception as e:
+        print(f"Error getting anchor changes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/anchors/stream', methods=['GET'])
+@cross_origin()
+def stream_anchor_changes():
+    """Server-sent events: a snapshot, then each change as it happens.
+    
+    Event ids are versions, so a reconnecting EventSource resumes from
+    Last-Event-ID and gets only what it missed.
+    """
+    since = request.headers.get('Last-Event-ID', request.args.get('since'))
+    timeout = anchor_poll_timeout()
+    
+    def event(kind, body):
+        return f"id: {body['version']}\nevent: {kind}\ndata: {json.dumps(body)}\n\n"
+    
+    def generate():
+        try:
+            cursor = int(since)
+        except (TypeError, ValueError):
+            cursor = None
+        if cursor is None:
+            version, anchors = anchor_registry.snapshot()
+            yield event('snapshot', {'version': version, 'anchors': anchors})
+            cursor = version
+        while True:
+            body = anchor_changes_since(cursor, timeout)
+            if body.get('reset'):
+                yield event('snapshot', body)
+            elif body['changes']:
+                for change in body['changes']:
+                    yield event('change', change)
+            else:
+                # Comment line; lets the server notice a closed connection
+                yield ': keepalive\n\n'
+            cursor = body['version']
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/anchors/unregister/<anchor_id>', methods=['DELETE', 'OPTIONS'])
 @cross_origin()
 def unregister_anchor(anchor_id):
@@ -310,8 +1444,7 @@ def unregister_anchor(anchor_id):
         return '', 204
     
     try:
-        if anchor_id in active_anchors:
-            del active_anchors[anchor_id]
+        if anchor_registry.unregister(anchor_id):
             print(f"Unregistered anchor: {anchor_id}")
             return jsonify({'success': True, 'message': f'Anchor {anchor_id} unregistered'})
         else:
@@ -320,6 +1453,150 @@ def unregister_anchor(anchor_id):
         print(f"Error unregistering anchor: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Per-device smoothing of trilaterated positions
+device_filters = per_map(lambda: DeviceFilters(
+    process_noise=map_setting('trilateration_process_noise', 1.0),
+    range_noise=map_setting('trilateration_range_noise', 0.1),
+    idle_timeout=map_setting('trilateration_device_timeout', 30),
+    max_devices=map_setting('trilateration_max_devices', 1024)))
+
+@app.route('/api/trilaterate', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def trilaterate_positions():
+    """Positions from UWB range batches of many devices, solved together.
+    
+    Takes {'measurements': [{'device', 'ranges': {anchor_id: meters}}, ...]}
+    against the registered anchors (or an 'anchors' object of {x, y} in the
+    request). Fixes are smoothed per device unless 'smooth' is false and
+    moved onto navigable cells unless 'snap' is false.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        if not navigator:
+            return jsonify({'error': 'Navigator not initialized'}), 500
+        
+        with phase('parse'):
+            data = request.get_json()
+            measurements = data.get('measurements') if isinstance(data, dict) else None
+            if not isinstance(measurements, list) or not measurements:
+                return jsonify({'error': 'Missing measurements list'}), 400
+            max_batch = map_setting('trilateration_max_batch', 10000)
+            if len(measurements) > max_batch:
+                return jsonify({'error': f'At most {max_batch} measurements per request'}), 400
+            smooth = data.get('smooth', bool(map_setting('trilateration_smoothing', False)))
+            snap = data.get('snap', bool(map_setting('snap_positions', False)))
+            # Registered anchors and device filters are per process
+            if PREFORK and (smooth or 'anchors' not in data):
+                return jsonify({'error': 'Trilateration needs "anchors" in the request and "smooth": false '
+                                         'when server_workers is above 1'}), 409
+            if 'anchors' in data:
+                anchors = data['anchors']
+            else:
+                anchors = {anchor['id']: anchor for anchor in anchor_registry.snapshot()[1]}
+        
+        with phase('convert'):
+            try:
+                columns = {}
+                for measurement in measurements:
+                    for anchor_id in measurement['ranges']:
+                        if anchor_id in anchors and anchor_id not in columns:
+                            columns[anchor_id] = len(columns)
+                anchor_xy = np.array([[float(anchors[a]['x']), float(anchors[a]['y'])] for a in columns]).reshape(-1, 2)
+                ranges = np.full((len(measurements), len(columns)), np.nan)
+                for row, measurement in enumerate(measurements):
+                    for anchor_id, distance in measurement['ranges'].items():
+                        if anchor_id in columns and distance is not None:
+                            ranges[row, columns[anchor_id]] = float(distance)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                return jsonify({'error': f'Each measurement needs a ranges object of anchor id to meters: {e}'}), 400
+        
+        with phase('solve'):
+            positions, rms = trilaterate(anchor_xy, ranges)
+            used = np.isfinite(ranges).sum(axis=1)
+            solved = np.isfinite(positions[:, 0])
+            if smooth:
+                now = time.time()
+                for row in np.nonzero(solved)[0]:
+                    device = measurements[row].get('device')
+                    if device is not None:
+                        positions[row] = device_filters.update(str(device), positions[row], rms[row], now)
+            cells = np.zeros((len(positions), 2), dtype=np.int64)
+            cells[solved] = np.round(positions[solved] / navigator.resolution).astype(np.int64)
+            if snap:
+                targets, snap_distances = navigator.snap_cells(cells)
+        
+        with phase('serialize'):
+            results = []
+            for row, measurement in enumerate(measurements):
+                result = {'index': row, 'device': measurement.get('device'), 'ranges_used': int(used[row])}
+                if not solved[row]:
+                    result.update(success=False, error=f'Needs ranges to at least {MIN_RANGES} anchors not on one line')
+                    results.append(result)
+                    continue
+                x, y = (round(float(v), 3) for v in positions[row])
+                x_pixels, y_pixels = (int(v) for v in cells[row])
+                valid = bool(navigator.is_valid_position(x_pixels, y_pixels))
+                if snap and 0 < snap_distances[row] < np.inf:
+                    x_pixels, y_pixels = (int(v) for v in targets[row])
+                    x, y = (round(v, 3) for v in navigator.pixels_to_meters(x_pixels, y_pixels))
+                    result['snapped'] = {'distance': round(float(snap_distances[row]), 3)}
+                    valid = True
+                result.update(success=True, x=x, y=y, x_pixels=x_pixels, y_pixels=y_pixels,
+                              valid=valid, rms=round(float(rms[row]), 3))
+                results.append(result)
+            return jsonify({'positions': results, 'anchors': len(columns)})
+    except Exception as e:
+        print(f"Error trilaterating: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def serve_workers(workers, host='0.0.0.0', port=8080):
+    """Pre-fork server: worker processes accept on one socket and share the read-only map"""
+    from werkzeug.serving import make_server
+    
+    shared = SharedArrays()
+    children = {}
+    
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                make_server(host, port, app, threaded=True, fd=listener.fileno()).serve_forever()
+            finally:
+                os._exit(1)
+        children[pid] = index
+    
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        navigator.share_memory(shared)
+        if route_table:
+            route_table.drain()
+        print(f"Sharing {shared.nbytes / (1024 * 1024):.1f}MB of map data with {workers} workers")
+        
+        listener = socket.create_server((host, port), backlog=128)
+        # Keep the planner structures built above out of the collector, whose
+        # bookkeeping would otherwise copy their pages into every worker
+        gc.freeze()
+        for index in range(workers):
+            spawn(index)
+        while True:
+            pid, status = os.wait()
+            index = children.pop(pid, None)
+            if index is not None:
+                print(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+                spawn(index)
+    except (KeyboardInterrupt, SystemExit):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    finally:
+        shared.unlink()
+
 if __name__ == '__main__':
     print("=" * 50)
     print("VALUENEX Office Map Server")
@@ -340,4 +1617,7 @@ if __name__ == '__main__':
     print("=" * 50)
     
     # Run with host='0.0.0.0' to allow external connections
-    app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
+    if PREFORK and navigator:
+        serve_workers(SERVER_WORKERS)
+    else:
+        app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+
+class RouteCache:
+    """Bounded LRU cache of routes keyed by quantized start/goal cells.
+
+    Start and goal are snapped to square buckets of ``quantization_pixels``
+    so repeated requests and trilateration jitter of a few pixels share one
+    entry. On a hit the requested start and goal are joined to the nearest
+    cells near the ends of the cached path by straight segments, so the
+    route always starts and ends at the exact cells; a wall in the way
+    counts as a miss. Paths are stored as int32 arrays to keep the byte
+    budget honest. Unreachable pairs are not cached, since another point of
+    the same bucket may well be reachable. The map and inflation settings
+    are fixed for the navigator's lifetime, so entries only go stale
+    through runtime obstacles, which ``invalidate`` handles.
+    """
+
+    def __init__(self, navigator, quantization_pixels: int = 10, max_entries: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.navigator = navigator
+        self.quantization_pixels = max(1, int(quantization_pixels))
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by invalidate, so a search that started before a map change
+        # cannot store its result after it
+        self.generation = 0
+
+    def _key(self, planner: str, start: Tuple[int, int], goal: Tuple[int, int]):
+        q = self.quantization_pixels
+        return (planner, int(start[0]) // q, int(start[1]) // q, int(goal[0]) // q, int(goal[1]) // q)
+
+    def get(self, planner: str, start: Tuple[int, int], goal: Tuple[int, int]):
+        """Return ``(path, distance)`` from ``start`` to ``goal`` on a hit, else None."""
+        key = self._key(planner, start, goal)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        route = None if entry is None else self._splice(entry[0], start, goal)
+        with self._lock:
+            if route is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return route
+
+    def _splice(self, path: np.ndarray, start: Tuple[int, int], goal: Tuple[int, int]):
+        """Join ``start`` and ``goal`` to a cached path from the same buckets.
+
+        Each end is joined to the closest cell among the path's first (or
+        last) ``2 * quantization_pixels + 1`` cells, which cuts off any
+        detour to the cached endpoint. Returns None if a joining segment
+        crosses an inflated obstacle.
+        """
+        nav = self.navigator
+        start = np.array([int(start[0]), int(start[1])])
+        goal = np.array([int(goal[0]), int(goal[1])])
+        reach = min(len(path), 2 * self.quantization_pixels + 1)
+        first = int(np.argmin(np.abs(path[:reach] - start).max(axis=1)))
+        last = len(path) - reach + int(np.argmin(np.abs(path[-reach:] - goal).max(axis=1)))
+        last = max(first, last)
+        head = _segment(start, path[first])
+        tail = _segment(path[last], goal)
+        if nav.inflated_map[head[:, 1], head[:, 0]].any() or nav.inflated_map[tail[:, 1], tail[:, 0]].any():
+            return None
+        points = np.concatenate((head[:-1], path[first:last + 1], tail[1:]))
+        distance = float(np.hypot(*np.diff(points, axis=0).T).sum()) * nav.resolution
+        return [tuple(p) for p in points.tolist()], distance
+
+    def put(self, planner: str, start: Tuple[int, int], goal: Tuple[int, int],
+            path: Optional[List[Tuple[int, int]]], distance: float, generation: Optional[int] = None):
+        """Store a route; ``generation`` is the value read before searching."""
+        if not path:
+            return
+        key = self._key(planner, start, goal)
+        stored = np.asarray(path, dtype=np.int32)
+        size = stored.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0].nbytes
+            self._entries[key] = (stored, distance)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (old_path, _) = self._entries.popitem(last=False)
+                self._bytes -= old_path.nbytes
+                self.evictions += 1
+
+    def invalidate(self, affected: Callable[[Optional[np.ndarray]], bool]) -> int:
+        """Drop the entries whose path ``affected`` rejects."""
+        with self._lock:
+            stale = [key for key, (path, _) in self._entries.items() if affected(path)]
+            for key in stale:
+                path, _ = self._entries.pop(key)
+                self._bytes -= path.nbytes
+            self.generation += 1
+            if stale:
+                self.invalidations += 1
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'quantization_pixels': self.quantization_pixels,
+            }
+
+
+def _segment(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """8-connected cells on the straight segment from a to b, both included."""
+    steps = int(np.abs(b - a).max())
+    return np.rint(np.linspace(a, b, steps + 1)).astype(np.int64)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+UNREACHABLE = 'unreachable'
+
+
+class RouteTable:
+    """All-pairs routes between named locations, filled by a background worker.
+
+    Routes are keyed by location name and looked up by pixel cell, so a
+    request whose endpoints land on named locations is answered without a
+    search. ``update`` diffs a new locations dict against the current one
+    and only recomputes the rows of locations that were added or moved.
+    """
+
+    def __init__(self, navigator, planner: str = 'jps', start: bool = True):
+        self.navigator = navigator
+        self.planner = planner
+        self._lock = threading.Lock()
+        self._cells: Dict[str, Tuple[int, int]] = {}
+        self._names_at: Dict[Tuple[int, int], str] = {}
+        self._routes: Dict[Tuple[str, str], object] = {}
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._generation = 0
+        self._worker = None
+        if start:
+            self.start()
+
+    def start(self):
+        """Start the background worker (pre-fork servers drain the queue before forking instead)."""
+        self._worker = threading.Thread(target=self._run, name='route-table', daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Let the background worker exit once the row it is computing is done."""
+        self._queue.put(None)
+
+    def drain(self):
+        """Compute every queued row in the calling thread."""
+        while True:
+            try:
+                name = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._process(name)
+
+    def update(self, locations: Dict[str, Dict]):
+        """Apply a full locations dict, invalidating only affected rows."""
+        cells = {name: self.navigator.meters_to_pixels(loc['x'], loc['y'])
+                 for name, loc in locations.items()}
+        with self._lock:
+            changed = {name for name, cell in cells.items() if self._cells.get(name) != cell}
+            removed = set(self._cells) - set(cells)
+            stale = changed | removed
+            self._routes = {pair: route for pair, route in self._routes.items()
+                            if pair[0] not in stale and pair[1] not in stale}
+            self._cells = cells
+            self._names_at = {cell: name for name, cell in cells.items()}
+            for name in sorted(changed - self._pending):
+                self._pending.add(name)
+                self._queue.put(name)
+        if stale:
+            print(f"Route table: recomputing {len(changed)} rows, dropped {len(removed)} locations")
+
+    def invalidate(self, affected: Callable[[Optional[List[Tuple[int, int]]]], bool]) -> int:
+        """Drop the routes whose path (None if unreachable) ``affected``
+        rejects and queue their rows again."""
+        with self._lock:
+            stale = [pair for pair, route in self._routes.items()
+                     if affected(None if route == UNREACHABLE else route[0])]
+            for pair in stale:
+                del self._routes[pair]
+            self._generation += 1
+            rows = {a for a, _ in stale}
+            for name in sorted(rows - self._pending):
+                self._pending.add(name)
+                self._queue.put(name)
+        if stale:
+            print(f"Route table: recomputing {len(stale)} routes in {len(rows)} rows after a map change")
+        return len(stale)
+
+    def cell_of(self, name: str) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            return self._cells.get(name)
+
+    def lookup(self, start: Tuple[int, int], goal: Tuple[int, int]):
+        """Return the stored route between two cells.
+
+        ``None`` means the pair is not in the table (yet), ``UNREACHABLE``
+        means it is known to have no path, otherwise ``(path, distance)``.
+        """
+        with self._lock:
+            a = self._names_at.get(tuple(start))
+            b = self._names_at.get(tuple(goal))
+            if a is None or b is None:
+                return None
+            if a == b:
+                return [tuple(start)], 0.0
+            route = self._routes.get((a, b) if a < b else (b, a))
+        if route is None or route == UNREACHABLE:
+            return route
+        path, distance = route
+        return (path if a < b else path[::-1]), distance
+
+    def distances(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Distances in meters between every computed pair (None if unreachable)."""
+        table: Dict[str, Dict[str, Optional[float]]] = {}
+        with self._lock:
+            for (a, b), route in self._routes.items():
+                distance = None if route == UNREACHABLE else round(route[1], 2)
+                table.setdefault(a, {})[b] = distance
+                table.setdefault(b, {})[a] = distance
+        return table
+
+    def status(self) -> Dict:
+        with self._lock:
+            count = len(self._cells)
+            return {
+                'planner': self.planner,
+                'locations': count,
+                'pairs': count * (count - 1) // 2,
+                'computed_pairs': len(self._routes),
+                'pending_rows': len(self._pending),
+            }
+
+    def _run(self):
+        while True:
+            name = self._queue.get()
+            if name is None:
+                return
+            self._process(name)
+
+    def _process(self, name: str):
+        with self._lock:
+            # A move during the computation must queue the row again
+            self._pending.discard(name)
+        try:
+            self._compute_row(name)
+        except Exception as e:
+            print(f"Route table: error computing row {name}: {e}")
+
+    def _compute_row(self, name: str):
+        with self._lock:
+            cells = dict(self._cells)
+        if name not in cells:
+            return
+
+        retry = False
+        for other in cells:
+            if other == name:
+                continue
+            pair = (name, other) if name < other else (other, name)
+            with self._lock:
+                if pair in self._routes:
+                    continue
+                generation = self._generation
+            a, b = pair
+            path = self.navigator.find_path(cells[a], cells[b], self.planner)
+            if path:
+                route = ([tuple(p) for p in path], self.navigator.calculate_path_length(path))
+            else:
+                route = UNREACHABLE
+            with self._lock:
+                # Drop the result if either endpoint moved while we searched
+                if self._cells.get(a) == cells[a] and self._cells.get(b) == cells[b]:
+                    if generation == self._generation:
+                        self._routes[pair] = route
+                    else:
+                        # The map changed during the search
+                        retry = True
+        if retry:
+            with self._lock:
+                if name not in self._pending:
+                    self._pending.add(name)
+                    self._queue.put(name)
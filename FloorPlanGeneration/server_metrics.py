@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import bisect
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+# Seconds; covers cache hits (sub-millisecond) up to full-map searches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """In-process counters, gauges and histograms in Prometheus text format.
+
+    Metrics are created on first use with a help string and identified by
+    name plus a label dict. Updates take one lock and touch a few list or
+    dict slots, so they are cheap enough for every request. Each process
+    keeps its own values; a pre-fork server exposes the worker that
+    answered the scrape.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._kinds: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._values: Dict[str, Dict[LabelKey, object]] = {}
+
+    def _series(self, kind: str, name: str, help_text: str):
+        if name not in self._kinds:
+            self._kinds[name] = kind
+            self._help[name] = help_text
+            self._values[name] = {}
+        return self._values[name]
+
+    def inc(self, name: str, amount: float = 1, help_text: str = '', **labels):
+        with self._lock:
+            series = self._series('counter', name, help_text)
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, help_text: str = '', kind: str = 'gauge', **labels):
+        """Set a gauge, or a counter kept elsewhere (``kind='counter'``)."""
+        with self._lock:
+            self._series(kind, name, help_text)[_labels(labels)] = value
+
+    def set_max(self, name: str, value: float, help_text: str = '', **labels):
+        """Raise a gauge to ``value`` if it is the largest seen so far."""
+        with self._lock:
+            series = self._series('gauge', name, help_text)
+            key = _labels(labels)
+            if value > series.get(key, value - 1):
+                series[key] = value
+
+    def observe(self, name: str, value: float, help_text: str = '', **labels):
+        with self._lock:
+            series = self._series('histogram', name, help_text)
+            key = _labels(labels)
+            state = series.get(key)
+            if state is None:
+                # Per-bucket counts (made cumulative when rendered), sum, count
+                state = series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._kinds):
+                kind = self._kinds[name]
+                if self._help[name]:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values[name].items()):
+                    if kind != 'histogram':
+                        lines.append(f"{name}{_format_labels(key)} {_format_number(value)}")
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                        cumulative += bucket
+                        le = _format_labels(key, [('le', _format_number(bound))])
+                        lines.append(f"{name}_bucket{le} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_number(total)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return '\n'.join(lines) + '\n'
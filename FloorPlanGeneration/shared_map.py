@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Dict
+
+
+class SharedArrays:
+    """Read-only NumPy arrays backed by POSIX shared memory.
+
+    ``publish`` copies an array into a shared memory block once and returns
+    a non-writeable view of it. Worker processes forked afterwards map the
+    same physical pages, so N workers hold one copy of the grids instead
+    of N, and an accidental write raises instead of silently duplicating
+    pages. Only the process that created the blocks unlinks them.
+    """
+
+    def __init__(self):
+        self._owner = os.getpid()
+        self._blocks: Dict[str, shared_memory.SharedMemory] = {}
+
+    def publish(self, name: str, array: np.ndarray) -> np.ndarray:
+        array = np.asarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        view.flags.writeable = False
+        self._blocks[name] = block
+        return view
+
+    @property
+    def nbytes(self) -> int:
+        return sum(block.size for block in self._blocks.values())
+
+    def unlink(self):
+        """Remove the blocks once the server exits; mappings stay valid until then."""
+        if os.getpid() != self._owner:
+            return
+        for block in self._blocks.values():
+            block.unlink()
+        self._blocks.clear()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import yaml
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from astar_navigation import FloorPlanNavigator
+
+
+@pytest.fixture
+def make_navigator(tmp_path):
+    """Build a navigator over ``free`` (bool array, True = walkable)."""
+    def make(free, **overrides):
+        free = np.asarray(free, dtype=bool)
+        height, width = free.shape
+        image_path = tmp_path / 'map.png'
+        Image.fromarray(np.where(free, 255, 0).astype(np.uint8)).save(image_path)
+        config = {'image': str(image_path), 'resolution': 0.05,
+                  'width_meters': width * 0.05, 'height_meters': height * 0.05,
+                  'robot_radius': 0.0, 'inflation_radius': 0.0}
+        config.update(overrides)
+        config_path = tmp_path / 'map.yaml'
+        config_path.write_text(yaml.safe_dump(config))
+        return FloorPlanNavigator(str(config_path))
+    return make
@@ -0,0 +1,15 @@
+import numpy as np
+
+
+def test_meters_to_pixels_keeps_far_edge_on_grid(make_navigator):
+    nav = make_navigator(np.ones((10, 20), dtype=bool))
+    width_m, height_m = 20 * nav.resolution, 10 * nav.resolution
+
+    assert nav.meters_to_pixels(width_m - 0.001, height_m - 0.001) == (19, 9)
+    assert nav.is_valid_position(*nav.meters_to_pixels(width_m - 0.001, height_m - 0.001))
+    assert not nav.is_valid_position(*nav.meters_to_pixels(width_m + 0.01, 0.0))
+
+    for x in range(20):
+        for y in range(10):
+            x_m, y_m = nav.pixels_to_meters(x, y)
+            assert nav.meters_to_pixels(round(x_m, 3), round(y_m, 3)) == (x, y)
@@ -0,0 +1,20 @@
+import numpy as np
+
+
+def test_clusters_joined_only_diagonally(make_navigator):
+    # The left cluster's free rows end where the right cluster's begin, so
+    # the only crossing is the diagonal step (7, 3) -> (8, 4)
+    free = np.zeros((16, 16), dtype=bool)
+    free[0:4, 0:8] = True
+    free[4:8, 8:16] = True
+    nav = make_navigator(free, hpa_cluster_size=8, hpa_entrance_spacing=8)
+
+    stats = {}
+    path = nav.find_path((1, 1), (14, 6), planner='hpa', stats=stats)
+
+    assert path is not None
+    assert path[0] == (1, 1) and path[-1] == (14, 6)
+    assert stats['fallback']
+    for (x0, y0), (x1, y1) in zip(path, path[1:]):
+        assert max(abs(x1 - x0), abs(y1 - y0)) == 1
+        assert free[y1, x1]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Fewer ranges leave a 2D position ambiguous
+MIN_RANGES = 3
+
+
+def trilaterate(anchors: np.ndarray, ranges: np.ndarray, iterations: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """Least-squares positions for a batch of range measurements.
+
+    ``anchors`` is (k, 2) in meters and ``ranges`` is (n, k) with NaN where
+    a device did not range an anchor. Each row is first solved in closed
+    form from the linearized equations ``|p|^2 - 2 a.p = r^2 - |a|^2``
+    (unknowns x, y and |p|^2), then refined by Gauss-Newton on the range
+    residuals. All rows are solved together with stacked small matrices.
+
+    Returns ``(positions, rms)``: (n, 2) positions and the RMS range
+    residual in meters. Rows with fewer than ``MIN_RANGES`` ranges, or
+    anchors on one line, get NaN.
+    """
+    anchors = np.asarray(anchors, dtype=np.float64).reshape(-1, 2)
+    ranges = np.asarray(ranges, dtype=np.float64).reshape(-1, len(anchors))
+    weights = np.isfinite(ranges).astype(np.float64)
+    r = np.where(weights > 0, ranges, 0.0)
+    count = weights.sum(axis=1)
+
+    # Closed form: rows [-2ax, -2ay, 1] . [x, y, |p|^2] = r^2 - |a|^2
+    design = np.column_stack([-2 * anchors, np.ones(len(anchors))])
+    target = r ** 2 - (anchors ** 2).sum(axis=1)
+    normal = np.einsum('nk,ki,kj->nij', weights, design, design)
+    rhs = np.einsum('nk,ki,nk->ni', weights, design, target)
+    solvable = np.abs(np.linalg.det(normal)) > 1e-9
+    normal[~solvable] = np.eye(3)
+    positions = np.linalg.solve(normal, rhs[..., None])[:, :2, 0]
+
+    for _ in range(iterations):
+        offsets = positions[:, None, :] - anchors[None, :, :]
+        distances = np.maximum(np.hypot(offsets[..., 0], offsets[..., 1]), 1e-9)
+        jacobian = offsets / distances[..., None]
+        residuals = distances - r
+        jtj = np.einsum('nk,nki,nkj->nij', weights, jacobian, jacobian)
+        jtr = np.einsum('nk,nki,nk->ni', weights, jacobian, residuals)
+        steady = np.abs(np.linalg.det(jtj)) > 1e-12
+        jtj[~steady] = np.eye(2)
+        jtr[~steady] = 0.0
+        positions = positions - np.linalg.solve(jtj, jtr[..., None])[..., 0]
+
+    offsets = positions[:, None, :] - anchors[None, :, :]
+    residuals = (np.hypot(offsets[..., 0], offsets[..., 1]) - r) * weights
+    rms = np.sqrt((residuals ** 2).sum(axis=1) / np.maximum(count, 1))
+    failed = ~solvable | (count < MIN_RANGES)
+    positions[failed] = np.nan
+    rms[failed] = np.nan
+    return positions, rms
+
+
+class DeviceFilters:
+    """Per-device Kalman smoothing of trilaterated positions.
+
+    Each device keeps a position and an isotropic variance. The variance
+    grows by ``(process_noise * dt)^2`` between fixes (a walker may have
+    moved) and each fix is weighted by its range residual, floored at
+    ``range_noise``, so a poor fix moves the estimate less. Devices idle
+    for ``idle_timeout`` seconds restart from their next fix, and the least
+    recently updated device is dropped beyond ``max_devices``.
+    """
+
+    def __init__(self, process_noise: float = 1.0, range_noise: float = 0.1,
+                 idle_timeout: float = 30.0, max_devices: int = 1024):
+        self.process_noise = float(process_noise)
+        self.range_noise = float(range_noise)
+        self.idle_timeout = float(idle_timeout)
+        self.max_devices = max(1, int(max_devices))
+        self._devices: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, device: str, position: np.ndarray, rms: float,
+               now: Optional[float] = None) -> np.ndarray:
+        """Fold a fix into the device's estimate and return the estimate."""
+        now = time.time() if now is None else now
+        noise = max(float(rms), self.range_noise) ** 2
+        with self._lock:
+            state = self._devices.pop(device, None)
+            if state is None or now - state[2] > self.idle_timeout:
+                estimate, variance = np.array(position, dtype=np.float64), noise
+            else:
+                estimate, variance, seen = state
+                variance += (self.process_noise * max(now - seen, 0.0)) ** 2
+                gain = variance / (variance + noise)
+                estimate = estimate + gain * (position - estimate)
+                variance *= 1 - gain
+            self._devices[device] = (estimate, variance, now)
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+            return estimate.copy()
+
+    def reset(self, device: str) -> bool:
+        with self._lock:
+            return self._devices.pop(device, None) is not None
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._devices)